@@ -1,59 +1,561 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, File, HTTPException, Request, UploadFile
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
+import asyncio
+import contextlib
+import importlib
+import json
+import os
+import time
 
 # Carrega as variáveis de ambiente do arquivo .env
 load_dotenv()
 
 # Importa os serviços
+from services import browser_service
+from services import cohort_service
 from services import gemini_service
-from services import history_service 
+from services import history_service
+from services import job_service
+from services import metrics_service
+from services import store_service
+from services import worker_service
+
+# Aquece o servidor na subida (configurável via .env): cria o cliente do Gemini,
+# monta o prompt e importa o pandas aqui e nos processos de trabalho
+STARTUP_WARMUP = os.environ.get("STARTUP_WARMUP", "false").lower() in ("1", "true", "yes")
+
+_warmup: asyncio.Task | None = None
+
+async def warm_up() -> None:
+    start = time.perf_counter()
+    try:
+        await asyncio.to_thread(gemini_service.warm_up)
+        await asyncio.to_thread(importlib.import_module, "pandas")
+        await worker_service.warm_up()
+    except Exception as e:
+        print(f"Erro ao aquecer o servidor: {e}")
+        raise
+    elapsed = time.perf_counter() - start
+    metrics_service.STAGE_SECONDS.observe(elapsed, stage="startup_warmup")
+    print(f"Servidor aquecido em {elapsed:.2f}s.")
+
+def warmup_status() -> str:
+    if _warmup is None:
+        return "disabled"
+    if not _warmup.done():
+        return "running"
+    if _warmup.cancelled() or _warmup.exception() is not None:
+        return "failed"
+    return "done"
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    global _warmup
+    if STARTUP_WARMUP:
+        # Em segundo plano: /health/live já responde, /health/ready espera o aquecimento
+        _warmup = asyncio.create_task(warm_up())
+    yield
+    if _warmup is not None:
+        _warmup.cancel()
+    # Encerra os processos que resumem os históricos
+    worker_service.shutdown()
 
 app = FastAPI(
     title="Analisador de Hábitos Digitais API",
     description="Uma API para analisar históricos de navegação usando Google Gemini.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Limite do histórico descompactado aceito nos endpoints de upload (em MB)
+MAX_UPLOAD_MB = int(os.environ.get("MAX_UPLOAD_MB", "1024"))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Limite do conteúdo enviado como texto no JSON de /analyze e /jobs (em KB).
+# O JSON inteiro fica em memória; históricos maiores devem usar os endpoints de upload
+MAX_JSON_CONTENT_KB = int(os.environ.get("MAX_JSON_CONTENT_KB", "2000"))
+
+# Limites dos endpoints de lote (equipes): históricos por requisição e quantos
+# resumos e chamadas à IA de um mesmo lote rodam ao mesmo tempo
+BATCH_MAX_HISTORIES = int(os.environ.get("BATCH_MAX_HISTORIES", "500"))
+BATCH_SUMMARY_CONCURRENCY = int(os.environ.get("BATCH_SUMMARY_CONCURRENCY", str(max(worker_service.HISTORY_WORKERS, 1))))
+BATCH_LLM_CONCURRENCY = int(os.environ.get("BATCH_LLM_CONCURRENCY", str(gemini_service.GEMINI_MAX_CONCURRENCY)))
+
 # Modelo de dados para o corpo da requisição
 class HistoryPayload(BaseModel):
     content: str
     filename: str
+    # Segredo aleatório que identifica o usuário na análise incremental (veja HISTORY_STORE_DB)
+    user_key: str | None = None
+
+class BatchPayload(BaseModel):
+    histories: list[HistoryPayload]
+    # Gera também o relatório individual de cada pessoa (uma chamada à IA por histórico)
+    member_analysis: bool = True
+    # Gera o relatório da equipe a partir da soma dos históricos
+    cohort_analysis: bool = True
+
+@app.middleware("http")
+async def record_request_duration(request: Request, call_next):
+    """
+    Registra a duração de cada requisição por rota (o padrão, não o caminho real) e status.
+    """
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        metrics_service.REQUEST_SECONDS.observe(
+            time.perf_counter() - start, method=request.method, route=path, status=str(status_code)
+        )
 
 @app.get("/", tags=["Root"])
 def read_root():
     return {"message": "Bem-vindo à API do Analisador de Hábitos Digitais"}
 
-@app.post("/analyze", tags=["Analysis"])
-async def analyze_history(payload: HistoryPayload):
+@app.get("/health/live", tags=["Health"])
+def health_live():
     """
-    Recebe o conteúdo de um histórico de navegação, resume-o e retorna a análise da IA.
+    Indica que o processo está respondendo; não verifica as dependências.
+    """
+    return {"status": "ok"}
+
+@app.get("/health/ready", tags=["Health"])
+def health_ready():
+    """
+    Indica se o servidor pode receber análises: a API do Gemini está configurada
+    e o aquecimento (com STARTUP_WARMUP) terminou. Caso contrário, responde 503.
+    Um aquecimento que falhou não impede as análises, que carregam tudo sob demanda.
+    """
+    checks = {"gemini": gemini_service.model_status(), "warmup": {"status": warmup_status()}}
+    ready = checks["gemini"]["status"] != "error" and checks["warmup"]["status"] != "running"
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "not_ready", "checks": checks}
+    )
+
+@app.get("/metrics", tags=["Root"], response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Métricas de latência por etapa, volume processado e uso da IA, no formato do Prometheus.
     """
+    return PlainTextResponse(metrics_service.render(), media_type="text/plain; version=0.0.4")
+
+def check_user_key(user_key: str | None) -> None:
+    """
+    Recusa chaves de usuário fracas antes de ler ou gravar o banco incremental.
+    """
+    if user_key and store_service.enabled():
+        try:
+            store_service.check_user_key(user_key)
+        except store_service.InvalidUserKeyError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+def check_payload(payload: HistoryPayload) -> None:
+    """
+    Recusa conteúdos vazios ou grandes demais antes de qualquer processamento.
+    """
+    check_user_key(payload.user_key)
     if not payload.content:
         raise HTTPException(status_code=400, detail="O conteúdo do histórico não pode estar vazio.")
 
+    # Limita o tamanho do conteúdo para evitar custos excessivos e sobrecarga
+    if len(payload.content) > MAX_JSON_CONTENT_KB * 1024:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Arquivo muito grande. O limite é de {MAX_JSON_CONTENT_KB}KB no JSON; "
+                   "envie arquivos maiores como upload (/analyze/upload ou /jobs/upload)."
+        )
+
+async def summarize_payload(payload: HistoryPayload, keep_counts: bool = False) -> dict:
+    """
+    Valida o conteúdo recebido e processa o histórico em uma única passada,
+    retornando o resumo (já reduzido ao orçamento de tokens), as reduções
+    aplicadas e os scores DISC.
+    """
+    check_payload(payload)
+
+    print(f"Recebida análise para o arquivo: {payload.filename}")
+
+    # 1. Resumir o histórico de navegação
+    print("Resumindo o histórico de navegação...")
+    with metrics_service.timed("summarize"):
+        return await run_summary(
+            worker_service.summarize_text(
+                payload.content, gemini_service.prompt_overhead_tokens(), keep_counts=keep_counts, user_key=payload.user_key
+            )
+        )
+
+async def save_upload(file: UploadFile) -> str:
+    """
+    Grava o upload (CSV puro, gzip ou zstd), em blocos, em um arquivo temporário
+    para o processo de trabalho e retorna o caminho. O UploadFile só pode ser
+    lido enquanto a requisição não terminou; o arquivo gravado pode ser resumido depois.
+    """
+    max_bytes = MAX_UPLOAD_MB * 1024 * 1024
+    received = 0
+    with worker_service.create_input_file() as input_file:
+        try:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                # O arquivo compactado nunca é maior que o conteúdo; o limite
+                # descompactado é verificado durante o resumo
+                received += len(chunk)
+                if received > max_bytes:
+                    raise HTTPException(status_code=413, detail=f"Arquivo muito grande. O limite é de {MAX_UPLOAD_MB}MB descompactados.")
+                input_file.write(chunk)
+        except BaseException:
+            input_file.close()
+            os.remove(input_file.name)
+            raise
+    return input_file.name
+
+async def summarize_saved_upload(path: str, keep_counts: bool = False, user_key: str | None = None) -> dict:
+    """
+    Resume em um processo de trabalho um upload gravado por save_upload, sem
+    manter o arquivo inteiro em memória. O arquivo é removido ao final.
+    """
+    history = await run_summary(
+        worker_service.summarize_file(
+            path, gemini_service.prompt_overhead_tokens(), MAX_UPLOAD_MB * 1024 * 1024,
+            keep_counts=keep_counts, user_key=user_key
+        )
+    )
+    print(f"Upload {history['encoding']} com {history['total_bytes']} bytes descompactados.")
+    return history
+
+async def summarize_upload(file: UploadFile, keep_counts: bool = False, user_key: str | None = None) -> dict:
+    """
+    Grava o upload em um arquivo temporário e o resume (veja save_upload e summarize_saved_upload).
+    """
+    print(f"Recebido upload para análise: {file.filename}")
+    print("Resumindo o histórico de navegação...")
+
+    # Inclui a leitura do upload, feita antes do resumo
+    with metrics_service.timed("summarize_upload"):
+        return await summarize_saved_upload(await save_upload(file), keep_counts, user_key)
+
+async def run_summary(summary) -> dict:
+    """
+    Aguarda o resumo feito pelo worker_service, convertendo os erros em respostas HTTP.
+    """
     try:
-        # Limita o tamanho do conteúdo para evitar custos excessivos e sobrecarga
-        # O limite do Gemini 1.5 Flash é grande, mas é bom ter uma salvaguarda.
-        # 2000kb é um bom começo.
-        if len(payload.content) > 2000 * 1024:
-             raise HTTPException(status_code=413, detail="Arquivo muito grande. O limite é de 2000KB.")
+        history = await summary
+    except (history_service.UnsupportedEncodingError, browser_service.UnsupportedDatabaseError) as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except history_service.CorruptedUploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except history_service.UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except worker_service.WorkerPoolBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    except worker_service.SummaryTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except store_service.StoreConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except store_service.InvalidUserKeyError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        print(f"Recebida análise para o arquivo: {payload.filename}")
+    if history["total_bytes"] == 0:
+        raise HTTPException(status_code=400, detail="O conteúdo do histórico não pode estar vazio.")
+    return history
 
-        # 1. Resumir o histórico de navegação
-        print("Resumindo o histórico de navegação...")
-        summarized_content = history_service.summarize_history_data(payload.content)
-        lines_count = len(summarized_content.strip().split('\n'))
-        print(f"Histórico resumido com {lines_count} linhas.")
+@app.post("/analyze", tags=["Analysis"])
+async def analyze_history(payload: HistoryPayload):
+    """
+    Recebe o conteúdo de um histórico de navegação, resume-o e retorna a análise da IA.
+    """
+    try:
+        history = await summarize_payload(payload)
 
         # 2. Enviar o conteúdo resumido para a análise da IA
         print("Enviando para análise da IA...")
-        analysis_result = gemini_service.generate_analysis(summarized_content)
+        analysis_result = await gemini_service.generate_analysis_async(history["summary"], history["reductions"])
         print("Análise gerada com sucesso.")
 
-        return {"filename": payload.filename, "analysis": analysis_result}
+        return {
+            "filename": payload.filename,
+            "analysis": analysis_result,
+            "disc_scores": history["disc_scores"],
+            "reductions": history["reductions"],
+        }
+    except HTTPException:
+        raise
+    except gemini_service.GeminiOverloadedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    except gemini_service.GeminiRateLimitError as e:
+        raise HTTPException(status_code=429, detail=f"Limite de requisições da IA atingido: {e}", headers={"Retry-After": "60"})
     except Exception as e:
         # Adiciona um print do erro no console para facilitar o debug
         print(f"Erro no servidor: {e}")
         raise HTTPException(status_code=500, detail=f"Ocorreu um erro inesperado no servidor: {e}")
+
+@app.post("/analyze/upload", tags=["Analysis"])
+async def analyze_upload(file: UploadFile = File(...), user_key: str | None = None):
+    """
+    Igual a /analyze, mas recebe o arquivo via multipart, opcionalmente compactado (gzip ou zstd).
+    """
+    check_user_key(user_key)
+    try:
+        history = await summarize_upload(file, user_key=user_key)
+
+        print("Enviando para análise da IA...")
+        analysis_result = await gemini_service.generate_analysis_async(history["summary"], history["reductions"])
+        print("Análise gerada com sucesso.")
+
+        return {
+            "filename": file.filename,
+            "analysis": analysis_result,
+            "disc_scores": history["disc_scores"],
+            "reductions": history["reductions"],
+        }
+    except HTTPException:
+        raise
+    except gemini_service.GeminiOverloadedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    except gemini_service.GeminiRateLimitError as e:
+        raise HTTPException(status_code=429, detail=f"Limite de requisições da IA atingido: {e}", headers={"Retry-After": "60"})
+    except Exception as e:
+        print(f"Erro no servidor: {e}")
+        raise HTTPException(status_code=500, detail=f"Ocorreu um erro inesperado no servidor: {e}")
+
+def check_batch_size(count: int) -> None:
+    if count == 0:
+        raise HTTPException(status_code=400, detail="Envie ao menos um histórico.")
+    if count > BATCH_MAX_HISTORIES:
+        raise HTTPException(status_code=413, detail=f"Lote muito grande. O limite é de {BATCH_MAX_HISTORIES} históricos.")
+
+def batch_error(event: dict, error: Exception) -> dict:
+    """
+    Completa o evento de um histórico do lote com o erro ocorrido, no mesmo
+    formato de status das respostas dos endpoints individuais.
+    """
+    if isinstance(error, HTTPException):
+        status_code, detail = error.status_code, error.detail
+    elif isinstance(error, gemini_service.GeminiOverloadedError):
+        status_code, detail = 503, str(error)
+    elif isinstance(error, gemini_service.GeminiRateLimitError):
+        status_code, detail = 429, f"Limite de requisições da IA atingido: {error}"
+    else:
+        print(f"Erro no servidor: {error}")
+        status_code, detail = 500, f"Ocorreu um erro inesperado no servidor: {error}"
+    event.update({"status": "error", "status_code": status_code, "detail": detail})
+    return event
+
+async def batch_events(members: list, member_analysis: bool, cohort_analysis: bool):
+    """
+    Resume os históricos do lote em paralelo e produz um evento NDJSON por
+    histórico, na ordem em que terminam, seguido do evento da equipe.
+
+    `members` é uma lista de (filename, summarize), onde summarize() retorna
+    a corrotina que resume o histórico.
+    """
+    cohort = cohort_service.Cohort()
+    summary_slots = asyncio.Semaphore(BATCH_SUMMARY_CONCURRENCY)
+    llm_slots = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+
+    async def analyze_member(index: int, filename: str, summarize) -> dict:
+        event = {"type": "member", "index": index, "filename": filename}
+        try:
+            async with summary_slots:
+                history = await summarize()
+            cohort.add(history)
+            event.update({"disc_scores": history["disc_scores"], "reductions": history["reductions"]})
+            if member_analysis:
+                async with llm_slots:
+                    event["analysis"] = await gemini_service.generate_analysis_async(history["summary"], history["reductions"])
+            event["status"] = "done"
+            return event
+        except Exception as e:
+            return batch_error(event, e)
+
+    async def analyze_cohort() -> dict:
+        event = {"type": "cohort", "members": cohort.members, "failed": len(members) - cohort.members}
+        try:
+            summary, reductions = await asyncio.to_thread(cohort.summary, gemini_service.prompt_overhead_tokens())
+            event.update({"disc_scores": cohort.disc_scores(), "reductions": reductions})
+            if cohort_analysis:
+                async with llm_slots:
+                    event["analysis"] = await gemini_service.generate_analysis_async(summary, reductions, cohort_size=cohort.members)
+            event["status"] = "done"
+            return event
+        except Exception as e:
+            return batch_error(event, e)
+
+    tasks = [asyncio.create_task(analyze_member(index, filename, summarize))
+             for index, (filename, summarize) in enumerate(members)]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield json.dumps(await finished, ensure_ascii=False) + "\n"
+        if cohort.members:
+            yield json.dumps(await analyze_cohort(), ensure_ascii=False) + "\n"
+    finally:
+        # Se o cliente desconectar, os resumos e chamadas pendentes são cancelados
+        for task in tasks:
+            task.cancel()
+
+@app.post("/analyze/batch", tags=["Analysis"])
+async def analyze_batch(payload: BatchPayload):
+    """
+    Analisa os históricos de uma equipe em uma única requisição.
+    Transmite em NDJSON um evento `member` por histórico, conforme cada um termina,
+    e ao final um evento `cohort` com os scores DISC médios e o relatório da equipe.
+    """
+    check_batch_size(len(payload.histories))
+    print(f"Recebido lote com {len(payload.histories)} históricos.")
+    members = [
+        (history.filename, lambda history=history: summarize_payload(history, keep_counts=True))
+        for history in payload.histories
+    ]
+    return StreamingResponse(
+        batch_events(members, payload.member_analysis, payload.cohort_analysis),
+        media_type="application/x-ndjson"
+    )
+
+def remove_uploads(paths: list[str]) -> None:
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+@app.post("/analyze/batch/upload", tags=["Analysis"])
+async def analyze_batch_upload(files: list[UploadFile] = File(...), member_analysis: bool = True,
+                               cohort_analysis: bool = True):
+    """
+    Igual a /analyze/batch, mas recebe os históricos como arquivos via multipart
+    (campo `files`, repetido), opcionalmente compactados (gzip ou zstd).
+    """
+    check_batch_size(len(files))
+    print(f"Recebido lote com {len(files)} históricos.")
+
+    # Os UploadFile são fechados quando o endpoint retorna, antes da transmissão:
+    # os arquivos são gravados agora e resumidos a partir dos caminhos
+    paths = []
+    try:
+        for file in files:
+            paths.append(await save_upload(file))
+    except BaseException:
+        remove_uploads(paths)
+        raise
+    members = [
+        (file.filename, lambda path=path: summarize_saved_upload(path, keep_counts=True))
+        for file, path in zip(files, paths)
+    ]
+
+    async def events():
+        try:
+            async for event in batch_events(members, member_analysis, cohort_analysis):
+                yield event
+        finally:
+            # Históricos que não chegaram a ser resumidos (cliente desconectou)
+            remove_uploads(paths)
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+async def job_summary(summary) -> dict:
+    """
+    Aguarda o resumo dentro de um job, convertendo os erros HTTP em falha do job.
+    """
+    try:
+        return await summary
+    except HTTPException as e:
+        raise job_service.JobFailedError(e.detail, e.status_code)
+
+@app.post("/jobs", tags=["Jobs"], status_code=202)
+async def submit_job(payload: HistoryPayload):
+    """
+    Inicia em segundo plano o resumo do histórico e a análise da IA.
+    Retorna o id do job, usado para consultar o status ou acompanhar o relatório;
+    os scores DISC ficam disponíveis assim que o resumo termina.
+    """
+    check_payload(payload)
+    try:
+        job = job_service.create_job(payload.filename, lambda: job_summary(summarize_payload(payload)))
+        return job.to_dict()
+    except job_service.JobQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    except Exception as e:
+        print(f"Erro no servidor: {e}")
+        raise HTTPException(status_code=500, detail=f"Ocorreu um erro inesperado no servidor: {e}")
+
+@app.post("/jobs/upload", tags=["Jobs"], status_code=202)
+async def submit_upload_job(file: UploadFile = File(...), user_key: str | None = None):
+    """
+    Igual a /jobs, mas recebe o arquivo via multipart, opcionalmente compactado (gzip ou zstd).
+    O upload é gravado antes da resposta; o resumo roda dentro do job.
+    """
+    check_user_key(user_key)
+    print(f"Recebido upload para análise: {file.filename}")
+    path = await save_upload(file)
+    try:
+        job = job_service.create_job(
+            file.filename, lambda: job_summary(summarize_saved_upload(path, user_key=user_key))
+        )
+        return job.to_dict()
+    except job_service.JobQueueFullError as e:
+        os.remove(path)
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    except Exception as e:
+        os.remove(path)
+        print(f"Erro no servidor: {e}")
+        raise HTTPException(status_code=500, detail=f"Ocorreu um erro inesperado no servidor: {e}")
+
+def get_job_or_404(job_id: str) -> job_service.Job:
+    job = job_service.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado ou expirado.")
+    return job
+
+@app.get("/jobs/{job_id}", tags=["Jobs"])
+def get_job_status(job_id: str):
+    """
+    Retorna o status do job e, quando concluído, o relatório completo.
+    """
+    return get_job_or_404(job_id).to_dict()
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.get("/jobs/{job_id}/stream", tags=["Jobs"])
+async def stream_job(job_id: str):
+    """
+    Transmite o relatório em Markdown via Server-Sent Events, parte por parte.
+    Eventos: `summary` (scores DISC e reduções, assim que o histórico é
+    resumido), `chunk` (texto gerado), `done` e `error`.
+    """
+    job = get_job_or_404(job_id)
+
+    async def events():
+        async for event in job.follow():
+            if event is None:
+                yield ": keep-alive\n\n"
+            elif event[0] == "summary":
+                yield sse_event("summary", event[1])
+            else:
+                yield sse_event("chunk", {"text": event[1]})
+        if job.status == "error":
+            yield sse_event("error", {"detail": job.error, "status_code": job.status_code})
+        else:
+            yield sse_event("done", {"job_id": job.id})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.delete("/users/{user_key}/history", tags=["Analysis"], status_code=204)
+def delete_user_history(user_key: str):
+    """
+    Apaga os agregados guardados para a análise incremental de um usuário.
+    """
+    if not store_service.enabled():
+        raise HTTPException(status_code=404, detail="A análise incremental não está ativada.")
+    check_user_key(user_key)
+    if not store_service.delete_user(user_key):
+        raise HTTPException(status_code=404, detail="Nenhum dado encontrado para este usuário.")
@@ -0,0 +1,218 @@
+import os
+import pathlib
+import re
+import sqlite3
+
+from . import disc_service
+from . import history_service
+from . import metrics_service
+
+# Assinatura dos arquivos SQLite (Chrome `History`, Firefox `places.sqlite`)
+SQLITE_MAGIC = b'SQLite format 3\x00'
+
+# Operações da máquina virtual do SQLite entre duas verificações de prazo/cancelamento
+PROGRESS_STEPS = 100_000
+
+# Visitas de cada navegador, com a URL (id) e o dia (UTC) de cada visita.
+# Chrome grava microssegundos desde 1601-01-01 e Firefox desde 1970-01-01.
+# Visitas que o próprio navegador não mostra no histórico ficam de fora:
+# subframes no Chrome (transição 3 e 4) e embeds/frames no Firefox (tipos 4 e 8).
+BROWSERS = {
+    'chrome': {
+        'tables': {'urls', 'visits'},
+        'urls': 'urls',
+        'visits': (
+            "SELECT url AS url_id, date(visit_time / 1000000 - 11644473600, 'unixepoch') AS day "
+            "FROM visits WHERE (transition & 255) NOT IN (3, 4)"
+        ),
+    },
+    'firefox': {
+        'tables': {'moz_places', 'moz_historyvisits'},
+        'urls': 'moz_places',
+        'visits': (
+            "SELECT place_id AS url_id, date(visit_date / 1000000, 'unixepoch') AS day "
+            "FROM moz_historyvisits WHERE visit_type NOT IN (4, 8)"
+        ),
+    },
+}
+
+# Visitas por (domínio, dia). As visitas são somadas primeiro por URL e dia,
+# então hostname() roda uma vez por par e não uma vez por visita.
+DAILY_QUERY = """
+SELECT hostname(u.url) AS domain, v.day, SUM(v.visits)
+FROM (SELECT url_id, day, COUNT(*) AS visits FROM ({visits}) GROUP BY url_id, day) AS v
+JOIN {urls} AS u ON u.id = v.url_id
+GROUP BY domain, v.day
+"""
+
+# Visitas por URL completa, para os scores DISC
+URL_QUERY = """
+SELECT u.url, v.visits
+FROM (SELECT url_id, COUNT(*) AS visits FROM ({visits}) GROUP BY url_id) AS v
+JOIN {urls} AS u ON u.id = v.url_id
+"""
+
+_url_prefix = re.compile(history_service.URL_PREFIX_PATTERN)
+
+class UnsupportedDatabaseError(Exception):
+    """O banco SQLite enviado não é um histórico do Chrome nem do Firefox."""
+
+def _hostname(url: str | None) -> str:
+    """
+    get_hostname para o SQLite, com o mesmo cache por prefixo de extract_hostnames.
+    """
+    if url is None:
+        return 'invalid_or_other'
+    return history_service._hostname_for_prefix(_url_prefix.match(url).group(1))
+
+def is_database(path: str) -> bool:
+    """
+    Indica se o upload (puro, gzip ou zstd) é um banco SQLite, e não um CSV.
+    """
+    decompressor = history_service.StreamDecompressor()
+    try:
+        with open(path, 'rb') as upload:
+            chunk = upload.read(history_service.CHUNK_SIZE)
+        header = decompressor.decompress(chunk) if chunk else decompressor.flush()
+    except (history_service.UnsupportedEncodingError, history_service.CorruptedUploadError):
+        return False # O caminho do CSV relata o erro
+    return header.startswith(SQLITE_MAGIC)
+
+def _decompress_to(path: str, target: str, max_bytes: int | None, check) -> tuple[str, int]:
+    """
+    Grava em `target` o banco descompactado; o SQLite precisa de um arquivo para abrir.
+    """
+    decompressor = history_service.StreamDecompressor()
+    total_bytes = 0
+    with open(path, 'rb') as upload, open(target, 'wb') as database:
+        while True:
+            if check is not None:
+                check()
+            chunk = upload.read(history_service.CHUNK_SIZE)
+            data = decompressor.decompress(chunk) if chunk else decompressor.flush()
+            total_bytes += len(data)
+            if max_bytes is not None and total_bytes > max_bytes:
+                raise history_service.UploadTooLargeError(
+                    f"Arquivo muito grande. O limite é de {max_bytes // (1024 * 1024)}MB descompactados."
+                )
+            database.write(data)
+            if not chunk:
+                break
+    return decompressor.encoding, total_bytes
+
+def _connect(path: str) -> sqlite3.Connection:
+    # immutable=1: o arquivo é só leitura e não é alterado por mais ninguém,
+    # então o SQLite dispensa bloqueios e o journal/WAL
+    uri = pathlib.Path(path).resolve().as_uri() + "?mode=ro&immutable=1"
+    db = sqlite3.connect(uri, uri=True)
+    db.create_function("hostname", 1, _hostname, deterministic=True)
+    return db
+
+def detect_browser(db: sqlite3.Connection) -> str:
+    tables = {row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    for browser, spec in BROWSERS.items():
+        if spec['tables'] <= tables:
+            return browser
+    raise UnsupportedDatabaseError(
+        "O banco enviado não é um histórico do Chrome (History) nem do Firefox (places.sqlite)."
+    )
+
+def aggregate_database(db: sqlite3.Connection, browser: str, batch_rows: int = history_service.BATCH_ROWS) -> dict:
+    """
+    Agrega as visitas do banco por (domínio, dia) e calcula os scores DISC.
+    Toda a contagem é feita pelo SQLite; só o agregado chega ao Python.
+    """
+    import pandas as pd
+
+    spec = BROWSERS[browser]
+    counts: dict[tuple[str, str], int] = {}
+    rows_parsed = rows_dropped = 0
+
+    with metrics_service.timed("sql_aggregation"):
+        for domain, day, visits in db.execute(DAILY_QUERY.format(**spec)):
+            if day is None:
+                rows_dropped += visits # Data fora do intervalo aceito pelo SQLite
+                continue
+            counts[(domain, day)] = visits
+            rows_parsed += visits
+
+    disc_scores = disc_service.empty_scores()
+    cursor = db.execute(URL_QUERY.format(**spec))
+    while True:
+        with metrics_service.timed("sql_aggregation"):
+            rows = cursor.fetchmany(batch_rows)
+        if not rows:
+            break
+        with metrics_service.timed("disc_scoring"):
+            df = pd.DataFrame(rows, columns=['URL', 'Visit Count']).dropna()
+            disc_service.add_scores(disc_scores, df['URL'], df['Visit Count'])
+
+    if rows_dropped:
+        print(f"Aviso no backend: {rows_dropped} visitas ignoradas por data inválida.")
+    metrics_service.ROWS_PARSED.inc(rows_parsed)
+    metrics_service.ROWS_DROPPED.inc(rows_dropped)
+    return {
+        "summary": history_service.format_summary(counts),
+        "disc_scores": disc_service.normalize_scores(disc_scores),
+        "rows_parsed": rows_parsed,
+        "rows_dropped": rows_dropped,
+        "counts": counts,
+    }
+
+def analyze_history_file(path: str, max_bytes: int | None = None, check=None) -> dict:
+    """
+    Igual a history_service.analyze_history_file, para o banco de histórico do
+    Chrome (`History`) ou do Firefox (`places.sqlite`), puro ou compactado.
+    O banco é aberto só para leitura e as visitas são agregadas em SQL, com a
+    data de cada visita (o CSV das extensões traz só a última).
+    """
+    with open(path, 'rb') as upload:
+        header = upload.read(len(SQLITE_MAGIC))
+
+    database_path = path
+    if header == SQLITE_MAGIC:
+        encoding, total_bytes = 'identity', os.path.getsize(path)
+        if max_bytes is not None and total_bytes > max_bytes:
+            raise history_service.UploadTooLargeError(
+                f"Arquivo muito grande. O limite é de {max_bytes // (1024 * 1024)}MB descompactados."
+            )
+    else:
+        database_path = path + ".sqlite"
+
+    interrupted = []
+    def progress():
+        # Exceções não atravessam o SQLite: guarda o erro e interrompe a consulta
+        try:
+            check()
+        except Exception as e:
+            interrupted.append(e)
+            return 1
+        return 0
+
+    try:
+        if database_path != path:
+            encoding, total_bytes = _decompress_to(path, database_path, max_bytes, check)
+        db = _connect(database_path)
+        try:
+            if check is not None:
+                db.set_progress_handler(progress, PROGRESS_STEPS)
+            browser = detect_browser(db)
+            history = aggregate_database(db, browser)
+        except sqlite3.DatabaseError as e:
+            if interrupted:
+                raise interrupted[0] from None
+            raise history_service.CorruptedUploadError(f"Banco de histórico inválido: {e}")
+        finally:
+            db.close()
+    finally:
+        if database_path != path:
+            try:
+                os.remove(database_path)
+            except FileNotFoundError:
+                pass
+
+    print(f"Histórico do {browser} lido direto do banco: {history['rows_parsed']} visitas.")
+    history["encoding"] = encoding
+    history["source"] = browser
+    history["total_bytes"] = total_bytes
+    return history
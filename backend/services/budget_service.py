@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import io
+import math
+import os
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Orçamento de tokens do prompt enviado à IA (configurável via .env)
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", "100000"))
+# Dias mais recentes que permanecem com granularidade diária nas agregações
+BUDGET_RECENT_DAYS = int(os.environ.get("BUDGET_RECENT_DAYS", "30"))
+# Dias a partir dos quais as semanas são agregadas por mês
+BUDGET_MONTHLY_AFTER_DAYS = int(os.environ.get("BUDGET_MONTHLY_AFTER_DAYS", "90"))
+
+# Aproximação usual de caracteres por token para textos mistos de URLs e números
+CHARS_PER_TOKEN = 4
+
+# URL usada para a soma dos domínios menos visitados de cada período
+OTHER_BUCKET = 'other'
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estima a quantidade de tokens de um texto.
+    """
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def _to_csv(df: pd.DataFrame) -> str:
+    df = df.sort_values(by=['Start', 'Visit Count'], ascending=[False, False], kind='stable')
+    output_buffer = io.StringIO()
+    df[['URL', 'Date', 'Visit Count']].to_csv(output_buffer, index=False)
+    return output_buffer.getvalue()
+
+def _keep_top_domains(df: pd.DataFrame, k: int) -> pd.DataFrame:
+    """
+    Mantém os `k` domínios mais visitados de cada período e soma o restante em `other`.
+    """
+    import pandas as pd
+
+    is_other = df['URL'] == OTHER_BUCKET
+    ranked = df[~is_other].sort_values(by=['Start', 'Visit Count'], ascending=[False, False], kind='stable')
+    rank = ranked.groupby('Date', sort=False).cumcount()
+
+    kept = ranked[rank < k]
+    tail = pd.concat([ranked[rank >= k], df[is_other]])
+    if tail.empty:
+        return df
+
+    other = tail.groupby(['Date', 'Start'], as_index=False)['Visit Count'].sum()
+    other['URL'] = OTHER_BUCKET
+    return pd.concat([kept, other], ignore_index=True)
+
+def _largest_top_k(df: pd.DataFrame, low: int, high: int, fits) -> tuple[int, str]:
+    """
+    Busca binária do maior K entre `low` (que já cabe) e `high` para o qual
+    _keep_top_domains ainda cabe no orçamento. Retorna K e o CSV reduzido.
+    """
+    best_k, best_csv = low, _to_csv(_keep_top_domains(df, low))
+    low += 1
+    while low <= high:
+        k = (low + high) // 2
+        reduced_csv = _to_csv(_keep_top_domains(df, k))
+        if fits(reduced_csv):
+            best_k, best_csv = k, reduced_csv
+            low = k + 1
+        else:
+            high = k - 1
+    return best_k, best_csv
+
+def _roll_up(df: pd.DataFrame, older_than_days: int, period: str) -> pd.DataFrame:
+    """
+    Agrega por semana ('W') ou mês ('M') os períodos que começam antes do corte.
+    """
+    import pandas as pd
+
+    cutoff = df['Start'].max() - pd.Timedelta(days=older_than_days)
+    old = df['Start'] < cutoff
+    if not old.any():
+        return df
+
+    df = df.copy()
+    starts = df.loc[old, 'Start']
+    if period == 'W':
+        starts = starts - pd.to_timedelta(starts.dt.weekday, unit='D')
+        labels = starts.dt.strftime('%G-W%V')
+    else:
+        starts = starts - pd.to_timedelta(starts.dt.day - 1, unit='D')
+        labels = starts.dt.strftime('%Y-%m')
+    df.loc[old, 'Start'] = starts
+    df.loc[old, 'Date'] = labels
+
+    return df.groupby(['URL', 'Date', 'Start'], as_index=False)['Visit Count'].sum()
+
+def _truncate(csv_text: str, max_tokens: int, measure) -> tuple[str, int]:
+    """
+    Mantém as primeiras linhas do CSV (mais recentes e mais visitadas) que cabem em `max_tokens`.
+    """
+    lines = csv_text.splitlines(keepends=True)
+    # Proporção entre o tamanho medido e o do CSV, para formatos mais compactos
+    ratio = measure(csv_text) / max(estimate_tokens(csv_text), 1)
+    max_chars = int(max_tokens / max(ratio, 1e-9)) * CHARS_PER_TOKEN
+    while True:
+        kept = [lines[0]]
+        size = len(lines[0])
+        for line in lines[1:]:
+            if size + len(line) > max_chars:
+                break
+            kept.append(line)
+            size += len(line)
+        truncated = ''.join(kept)
+        if len(kept) == 1 or measure(truncated) <= max_tokens:
+            return truncated, len(kept) - 1
+        max_chars = int(max_chars * 0.9)
+
+def fit_summary_to_budget(summary_csv: str, overhead_tokens: int = 0,
+                          max_tokens: int = PROMPT_TOKEN_BUDGET, measure=estimate_tokens) -> tuple[str, list[str]]:
+    """
+    Reduz o CSV resumido até que o prompt estimado caiba em `max_tokens`.
+    As reduções são aplicadas em ordem, parando assim que o resumo cabe:
+    top-K domínios por dia (com o restante em `other`), agregação semanal e
+    mensal dos períodos mais antigos e, em último caso, corte das linhas finais.
+    Quando uma etapa de top-K faz o resumo caber, K é ajustado por busca binária
+    para o maior valor que ainda cabe; as agregações por semana ou mês não são
+    ajustáveis e podem deixar o resumo bem abaixo do limite.
+    `measure` estima os tokens do resumo como ele vai no prompt (veja encoding_service).
+    Retorna o CSV reduzido e a lista das reduções aplicadas.
+    """
+    available_tokens = max_tokens - overhead_tokens
+    if not summary_csv or measure(summary_csv) <= available_tokens:
+        return summary_csv, []
+    if not summary_csv.startswith('URL,Date,Visit Count'):
+        return summary_csv, [] # Mensagem de erro do resumo, não há o que reduzir
+
+    import pandas as pd
+
+    df = pd.read_csv(io.StringIO(summary_csv), dtype={'URL': str, 'Date': str})
+    df['Start'] = pd.to_datetime(df['Date'], format='%Y-%m-%d')
+
+    def fits(csv_text: str) -> bool:
+        return measure(csv_text) <= available_tokens
+
+    # (nome, etapa, K das etapas de top-K)
+    stages = [
+        ('top_20_domains_per_period', lambda d: _keep_top_domains(d, 20), 20),
+        ('top_10_domains_per_period', lambda d: _keep_top_domains(d, 10), 10),
+        (f'weekly_rollup_older_than_{BUDGET_RECENT_DAYS}_days', lambda d: _roll_up(d, BUDGET_RECENT_DAYS, 'W'), None),
+        (f'monthly_rollup_older_than_{BUDGET_MONTHLY_AFTER_DAYS}_days', lambda d: _roll_up(d, BUDGET_MONTHLY_AFTER_DAYS, 'M'), None),
+        ('top_5_domains_per_period', lambda d: _keep_top_domains(d, 5), 5),
+        (f'monthly_rollup_older_than_{BUDGET_RECENT_DAYS}_days', lambda d: _roll_up(d, BUDGET_RECENT_DAYS, 'M'), None),
+        ('top_3_domains_per_period', lambda d: _keep_top_domains(d, 3), 3),
+    ]
+
+    reductions = []
+    reduced_csv = _to_csv(df)
+    # Limite da busca de K: o maior número de domínios de um período
+    max_k = int(df.groupby('Date').size().max())
+    for name, stage, k in stages:
+        previous = df
+        df = stage(df)
+        stage_csv = _to_csv(df)
+        if stage_csv == reduced_csv:
+            continue # A etapa não alterou os dados
+        reduced_csv = stage_csv
+        if k is not None and fits(reduced_csv):
+            # O K fixo da etapa pode cortar muito mais que o necessário
+            k, reduced_csv = _largest_top_k(previous, k, max_k, fits)
+            name = f'top_{k}_domains_per_period'
+        reductions.append(name)
+        if fits(reduced_csv):
+            return reduced_csv, reductions
+        if k is not None:
+            max_k = k
+
+    reduced_csv, rows = _truncate(reduced_csv, max(available_tokens, 0), measure)
+    reductions.append(f'truncated_to_{rows}_rows')
+    return reduced_csv, reductions
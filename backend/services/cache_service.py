@@ -0,0 +1,156 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Configuração do cache de análises (configurável via .env)
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.environ.get("ANALYSIS_CACHE_MAX_ENTRIES", "128"))
+ANALYSIS_CACHE_TTL_SECONDS = float(os.environ.get("ANALYSIS_CACHE_TTL_SECONDS", str(24 * 3600)))
+# Caminho do banco SQLite; vazio desativa o cache em disco
+ANALYSIS_CACHE_DB = os.environ.get("ANALYSIS_CACHE_DB", "")
+ANALYSIS_CACHE_DB_MAX_BYTES = int(os.environ.get("ANALYSIS_CACHE_DB_MAX_BYTES", str(100 * 1024 * 1024)))
+
+def make_key(history_data: str, prompt_version: str, *extra: str) -> str:
+    """
+    Gera a chave do cache a partir do histórico resumido, da versão do prompt
+    e de parâmetros adicionais que alterem o prompt.
+    """
+    digest = hashlib.sha256()
+    for part in (prompt_version, *extra):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    digest.update(history_data.encode('utf-8'))
+    return digest.hexdigest()
+
+class AnalysisCache:
+    """
+    Cache de análises em dois níveis: LRU em memória e, opcionalmente, SQLite em disco.
+    As entradas expiram após `ttl_seconds`; o nível em memória guarda no máximo
+    `max_entries` itens e o banco no máximo `db_max_bytes` de análises.
+    """
+
+    def __init__(self, max_entries: int = ANALYSIS_CACHE_MAX_ENTRIES,
+                 ttl_seconds: float = ANALYSIS_CACHE_TTL_SECONDS,
+                 db_path: str = ANALYSIS_CACHE_DB,
+                 db_max_bytes: int = ANALYSIS_CACHE_DB_MAX_BYTES):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_max_bytes = db_max_bytes
+        self._memory: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+
+        self._db = None
+        if db_path:
+            try:
+                self._db = sqlite3.connect(db_path, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS analysis_cache ("
+                    " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+                    " created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                print(f"Erro ao abrir o cache em disco ({db_path}): {e}")
+                self._db = None
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created_at, value = entry
+                if now - created_at <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._memory[key]
+
+            value = self._get_from_disk(key, now)
+            if value is not None:
+                self.hits += 1
+                self.disk_hits += 1
+                return value
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._set_in_memory(key, value, now)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO analysis_cache VALUES (?, ?, ?, ?, ?)",
+                        (key, value, len(value.encode('utf-8')), now, now)
+                    )
+                    self._evict_from_disk(now)
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    print(f"Erro ao gravar no cache em disco: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "evictions": self.evictions,
+                "memory_entries": len(self._memory),
+            }
+
+    def _set_in_memory(self, key: str, value: str, created_at: float) -> None:
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _get_from_disk(self, key: str, now: float) -> str | None:
+        if self._db is None:
+            return None
+        try:
+            row = self._db.execute(
+                "SELECT value, created_at FROM analysis_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if now - created_at > self.ttl_seconds:
+                self._db.execute("DELETE FROM analysis_cache WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+            self._db.execute("UPDATE analysis_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self._db.commit()
+        except sqlite3.Error as e:
+            print(f"Erro ao ler o cache em disco: {e}")
+            return None
+
+        # Promove a entrada para o nível em memória
+        self._set_in_memory(key, value, created_at)
+        return value
+
+    def _evict_from_disk(self, now: float) -> None:
+        cursor = self._db.execute(
+            "DELETE FROM analysis_cache WHERE created_at < ?", (now - self.ttl_seconds,)
+        )
+        self.evictions += max(cursor.rowcount, 0)
+
+        total_size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM analysis_cache").fetchone()[0]
+        if total_size <= self.db_max_bytes:
+            return
+        # Remove as entradas usadas há mais tempo até caber no limite
+        for key, size in self._db.execute(
+            "SELECT key, size FROM analysis_cache ORDER BY accessed_at"
+        ).fetchall():
+            if total_size <= self.db_max_bytes:
+                break
+            self._db.execute("DELETE FROM analysis_cache WHERE key = ?", (key,))
+            total_size -= size
+            self.evictions += 1
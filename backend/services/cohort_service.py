@@ -0,0 +1,51 @@
+from . import budget_service
+from . import disc_service
+from . import encoding_service
+from . import history_service
+
+class Cohort:
+    """
+    Soma os históricos de uma equipe conforme cada um é resumido.
+
+    Guarda apenas o agregado (domínio, data) -> visitas de todos os membros e
+    os scores DISC de cada um, para que o relatório da equipe não dependa de
+    manter os resumos individuais em memória.
+    """
+
+    def __init__(self):
+        self.counts: dict[tuple[str, str], int] = {}
+        self.members = 0
+        self._disc_scores: list[dict[str, float]] = []
+
+    def add(self, history: dict) -> None:
+        """
+        Soma ao agregado da equipe um histórico resumido com `keep_counts`.
+        """
+        counts = self.counts
+        for key, value in history["counts"].items():
+            counts[key] = counts.get(key, 0) + value
+        self.members += 1
+        if history.get("disc_scores"):
+            self._disc_scores.append(history["disc_scores"])
+
+    def disc_scores(self) -> dict[str, float] | None:
+        """
+        Média dos perfis DISC dos membros; cada pessoa tem o mesmo peso,
+        independentemente de quanto navegou.
+        """
+        if not self._disc_scores:
+            return None
+        profiles = disc_service.empty_scores()
+        return {
+            profile: sum(scores[profile] for scores in self._disc_scores) / len(self._disc_scores)
+            for profile in profiles
+        }
+
+    def summary(self, overhead_tokens: int = 0) -> tuple[str, list[str]]:
+        """
+        Retorna o CSV resumido da equipe, já reduzido ao orçamento de tokens, e as reduções aplicadas.
+        """
+        return budget_service.fit_summary_to_budget(
+            history_service.format_summary(self.counts), overhead_tokens=overhead_tokens,
+            measure=encoding_service.summary_tokens
+        )
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import re
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# --- Dicionário de Palavras-chave para Análise DISC ---
+DISC_KEYWORDS = {
+    'Dominance (D)': [
+        'investing.com', 'tradingview.com', 'bloomberg.com', 'wsj.com', 'forbes.com',
+        'businessinsider.com', 'cnbc.com', 'reuters.com', 'marketwatch.com', 'financial',
+        'stocks', 'crypto', 'leadership', 'management', 'strategy', 'competition'
+    ],
+    'Influence (I)': [
+        'instagram.com', 'x.com', 'facebook.com', 'tiktok.com', 'linkedin.com',
+        'social', 'marketing', 'networking', 'influencer', 'fashion', 'entertainment',
+        'celebrity', 'events', 'community', 'trends'
+    ],
+    'Steadiness (S)': [
+        'pinterest.com', 'web.whatsapp.com', 'telegram.org', 'allrecipes.com', 'cooking',
+        'gardening', 'family', 'home', 'well-being', 'meditation', 'community',
+        'support', 'routine', 'planning', 'stability'
+    ],
+    'Conscientiousness (C)': [
+        'github.com', 'stackoverflow.com', 'scholar.google.com', 'arxiv.org', 'pypi.org',
+        'docs.python.org', 'medium.com', 'wikipedia.org', 'research', 'analysis', 'data',
+        'science', 'programming', 'tutorial', 'documentation', 'learning', 'how-to'
+    ]
+}
+
+# Cada lista de palavras-chave é compilada uma única vez em uma regex combinada,
+# aplicada de forma vetorizada sobre a coluna de URLs.
+DISC_PATTERNS = {
+    profile: re.compile('|'.join(re.escape(keyword) for keyword in keywords))
+    for profile, keywords in DISC_KEYWORDS.items()
+}
+
+def empty_scores() -> dict[str, int]:
+    return {profile: 0 for profile in DISC_KEYWORDS}
+
+def add_scores(scores: dict[str, int], urls: pd.Series, visit_counts: pd.Series) -> None:
+    """
+    Soma ao acumulado `scores` as visitas das URLs que contêm palavras-chave de cada perfil.
+    Uma URL conta uma única vez por perfil, mesmo com várias palavras-chave.
+    """
+    # Soma as visitas por URL distinta para testar cada URL uma única vez
+    url_counts = visit_counts.groupby(urls.str.lower(), sort=False).sum()
+    distinct_urls = url_counts.index.to_series()
+
+    for profile, pattern in DISC_PATTERNS.items():
+        matches = distinct_urls.str.contains(pattern, regex=True)
+        scores[profile] += int(url_counts[matches.to_numpy()].sum())
+
+def normalize_scores(scores: dict[str, int]) -> dict[str, float] | None:
+    """
+    Converte os scores DISC em percentuais. Retorna None se nenhuma palavra-chave foi encontrada.
+    """
+    total_score = sum(scores.values())
+    if total_score == 0:
+        return None
+    return {k: (v / total_score) * 100 for k, v in scores.items()}
@@ -0,0 +1,111 @@
+import csv
+import io
+import os
+
+from . import budget_service
+
+# Formato do histórico resumido enviado no prompt (configurável via .env):
+# 'csv' (uma linha por domínio e dia) ou 'compact' (dicionário de domínios)
+SUMMARY_ENCODING = os.environ.get("SUMMARY_ENCODING", "csv").lower()
+ENCODINGS = ('csv', 'compact')
+if SUMMARY_ENCODING not in ENCODINGS:
+    print(f"SUMMARY_ENCODING inválido ({SUMMARY_ENCODING}); usando 'csv'.")
+    SUMMARY_ENCODING = 'csv'
+
+CSV_HEADER = ['URL', 'Date', 'Visit Count']
+DOMAINS_SECTION = '[domains]'
+VISITS_SECTION = '[visits]'
+
+class InvalidEncodingError(ValueError):
+    """O texto não está no formato compacto esperado."""
+
+def encode_compact(summary_csv: str) -> str:
+    """
+    Converte o CSV resumido (URL,Date,Visit Count) no formato compacto, em que
+    cada domínio e cada data aparecem uma única vez:
+
+        [domains]
+        0 https://www.youtube.com
+        1 https://github.com
+        [visits]
+        2024-05-02 1:40 0:12
+        2024-05-01 0:34 1:12
+
+    Os ids são atribuídos pelo total de visitas (os domínios mais visitados têm
+    os ids mais curtos). As linhas de cada dia seguem a ordem do CSV, de modo
+    que decode_compact reconstrói o CSV original exatamente.
+    """
+    if not summary_csv:
+        return summary_csv
+
+    rows = list(csv.reader(io.StringIO(summary_csv)))
+    if not rows or rows[0] != CSV_HEADER:
+        return summary_csv # Não é um resumo (ex: mensagem de erro); segue como está
+    rows = rows[1:]
+
+    totals: dict[str, int] = {}
+    for url, _, count in rows:
+        totals[url] = totals.get(url, 0) + int(count)
+    ranked = sorted(totals, key=lambda url: -totals[url])
+    ids = {url: index for index, url in enumerate(ranked)}
+
+    lines = [DOMAINS_SECTION]
+    lines.extend(f"{index} {url}" for index, url in enumerate(ranked))
+    lines.append(VISITS_SECTION)
+
+    # Linhas consecutivas da mesma data formam uma linha do formato compacto
+    current_date, pairs = None, []
+    for url, date, count in rows:
+        if date != current_date:
+            if pairs:
+                lines.append(f"{current_date} {' '.join(pairs)}")
+            current_date, pairs = date, []
+        pairs.append(f"{ids[url]}:{count}")
+    if pairs:
+        lines.append(f"{current_date} {' '.join(pairs)}")
+
+    return '\n'.join(lines) + '\n'
+
+def decode_compact(text: str) -> str:
+    """
+    Reconstrói o CSV resumido a partir do formato compacto (inverso de encode_compact).
+    """
+    if not text:
+        return text
+    if not text.startswith(DOMAINS_SECTION):
+        return text
+
+    lines = text.splitlines()
+    try:
+        split = lines.index(VISITS_SECTION)
+    except ValueError:
+        raise InvalidEncodingError(f"Seção {VISITS_SECTION} não encontrada.")
+
+    urls = {}
+    for line in lines[1:split]:
+        index, url = line.split(' ', 1)
+        urls[index] = url
+
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator='\n')
+    writer.writerow(CSV_HEADER)
+    for line in lines[split + 1:]:
+        date, *pairs = line.split(' ')
+        for pair in pairs:
+            index, count = pair.split(':')
+            writer.writerow([urls[index], date, count])
+    return output.getvalue()
+
+def encode(summary_csv: str, encoding: str | None = None) -> str:
+    """
+    Serializa o resumo no formato usado no prompt (por padrão, SUMMARY_ENCODING).
+    """
+    if (encoding or SUMMARY_ENCODING) == 'compact':
+        return encode_compact(summary_csv)
+    return summary_csv
+
+def summary_tokens(summary_csv: str, encoding: str | None = None) -> int:
+    """
+    Tokens estimados do resumo depois de serializado para o prompt.
+    """
+    return budget_service.estimate_tokens(encode(summary_csv, encoding))
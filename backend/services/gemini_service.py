@@ -1,34 +1,166 @@
 import os
-import google.generativeai as genai
+import asyncio
+import contextlib
+import functools
+import random
+import threading
+import time
 
-# Configura a API Key a partir das variáveis de ambiente
-try:
-    genai.configure(api_key=os.environ["GOOGLE_API_KEY"])
-    model = genai.GenerativeModel('gemini-1.5-flash') # Modelo atualizado e eficiente
-except Exception as e:
-    print(f"Erro ao configurar a API do Gemini: {e}")
-    print(f"{e}\n")
-    model = None
+from . import budget_service
+from . import cache_service
+from . import encoding_service
+from . import metrics_service
 
-def get_analysis_prompt(history_data: str) -> str:
+# Versão do prompt; altere ao mudar get_analysis_prompt para invalidar o cache
+PROMPT_VERSION = "3"
+
+# Limites das chamadas assíncronas ao Gemini (configuráveis via .env)
+GEMINI_MAX_CONCURRENCY = int(os.environ.get("GEMINI_MAX_CONCURRENCY", "4"))
+GEMINI_MAX_QUEUE = int(os.environ.get("GEMINI_MAX_QUEUE", "16"))
+GEMINI_TIMEOUT_SECONDS = float(os.environ.get("GEMINI_TIMEOUT_SECONDS", "120"))
+GEMINI_MAX_RETRIES = int(os.environ.get("GEMINI_MAX_RETRIES", "3"))
+GEMINI_RETRY_BASE_SECONDS = float(os.environ.get("GEMINI_RETRY_BASE_SECONDS", "1.0"))
+
+# Códigos HTTP que indicam limite de requisições ou falhas temporárias
+RATE_LIMIT_STATUS = 429
+RETRYABLE_STATUS = {RATE_LIMIT_STATUS, 500, 502, 503, 504}
+
+class GeminiOverloadedError(Exception):
+    """A fila de chamadas ao Gemini está cheia; a requisição deve ser recusada."""
+
+class GeminiRateLimitError(Exception):
+    """O Gemini continuou recusando por limite de requisições após as novas tentativas."""
+
+# Cliente do Gemini, criado na primeira análise (veja get_model): importar
+# google.generativeai leva mais de um segundo e atrasaria a subida do servidor
+model = None
+_model_error: str | None = None
+MISSING_KEY_MESSAGE = "A variável GOOGLE_API_KEY não está definida."
+_model_lock = threading.Lock()
+
+def get_model():
+    """
+    Retorna o cliente do Gemini, configurando a API Key na primeira chamada.
+    Retorna None se a chave não estiver definida ou a configuração falhar.
+    """
+    global model, _model_error
+    if model is not None or _model_error is not None:
+        return model
+
+    with _model_lock:
+        if model is None and _model_error is None:
+            try:
+                if not os.environ.get("GOOGLE_API_KEY"):
+                    raise ValueError(MISSING_KEY_MESSAGE)
+                import google.generativeai as genai
+                genai.configure(api_key=os.environ["GOOGLE_API_KEY"])
+                model = genai.GenerativeModel('gemini-1.5-flash') # Modelo atualizado e eficiente
+            except Exception as e:
+                _model_error = str(e)
+                print(f"Erro ao configurar a API do Gemini: {e}")
+    return model
+
+async def _get_model_async():
+    """
+    get_model sem travar o event loop enquanto a biblioteca é importada.
+    """
+    if model is not None or _model_error is not None:
+        return model
+    return await asyncio.to_thread(get_model)
+
+def model_status() -> dict:
+    """
+    Estado do cliente do Gemini para o endpoint de prontidão: 'ready' (criado),
+    'not_loaded' (será criado na primeira análise) ou 'error'.
+    """
+    if model is not None:
+        return {"status": "ready"}
+    if _model_error is not None:
+        return {"status": "error", "detail": _model_error}
+    if not os.environ.get("GOOGLE_API_KEY"):
+        return {"status": "error", "detail": MISSING_KEY_MESSAGE}
+    return {"status": "not_loaded"}
+
+# Cache das análises já geradas, indexado pelo histórico resumido
+analysis_cache = cache_service.AnalysisCache()
+
+# Estatísticas do cache exportadas em /metrics (lidas no momento da coleta)
+metrics_service.register_gauge("analysis_cache_hits_total", "Análises servidas pelo cache.",
+                               lambda: analysis_cache.stats()["hits"], metric_type="counter")
+metrics_service.register_gauge("analysis_cache_misses_total", "Análises não encontradas no cache.",
+                               lambda: analysis_cache.stats()["misses"], metric_type="counter")
+metrics_service.register_gauge("analysis_cache_entries", "Análises guardadas no cache em memória.",
+                               lambda: analysis_cache.stats()["memory_entries"])
+
+def get_reduction_note(reductions: list[str] | None, encoding: str = 'csv') -> str:
+    """
+    Explica à IA as reduções aplicadas ao resumo para caber no orçamento de tokens,
+    nos termos do formato em que o resumo é enviado (veja get_format_description).
+    """
+    if not reductions:
+        return ""
+    if encoding == 'compact':
+        details = (
+            f"O domínio `{budget_service.OTHER_BUCKET}` da seção `[domains]` soma os domínios menos visitados do período; "
+            "na seção `[visits]`, datas como `2024-W05` representam semanas e `2024-05`, meses inteiros. "
+            "Se houver corte, os dias mais antigos foram omitidos."
+        )
+    else:
+        details = (
+            f"Linhas com `URL` igual a `{budget_service.OTHER_BUCKET}` somam os domínios menos visitados do período; "
+            "na coluna `Date`, valores como `2024-W05` representam semanas e `2024-05`, meses inteiros. "
+            "Se houver corte de linhas, os dias mais antigos foram omitidos."
+        )
+    return f"**Reduções aplicadas:** Para caber no limite de tamanho, os dados foram reduzidos ({', '.join(reductions)}). {details}"
+
+def get_cohort_note(cohort_size: int | None) -> str:
+    """
+    Explica à IA que os dados somam os históricos de uma equipe, e não de uma pessoa.
+    """
+    if not cohort_size:
+        return ""
+    return (
+        f"**Análise de Equipe:** Os dados são a soma dos históricos de {cohort_size} pessoas de uma mesma equipe, "
+        "e não de um único usuário. Descreva padrões do grupo, sem inferências sobre indivíduos, "
+        "e dê ênfase às recomendações para o Observador/RH."
+    )
+
+def get_format_description(encoding: str) -> str:
+    """
+    Descreve à IA o formato em que o histórico resumido é enviado (veja encoding_service).
+    """
+    if encoding == 'compact':
+        return """**Atenção:** Os dados a seguir foram pré-processados e agregados por **domínio e dia**, em um formato compacto:
+    - A seção `[domains]` lista cada domínio uma única vez, no formato `id URL` (ex: `0 https://www.youtube.com`). Os ids menores são os domínios mais visitados no total.
+    - A seção `[visits]` tem uma linha por dia: a data (`Date`) seguida de pares `id:visitas` (ex: `2024-05-01 0:34 3:12` significa 34 visitas ao domínio 0 e 12 ao domínio 3 naquele dia).
+    - Em cada dia, os pares estão em ordem decrescente de visitas."""
+    return """**Atenção:** Os dados a seguir foram pré-processados e agregados. Cada linha representa o total de visitas para um **domínio específico em um único dia**.
+    - A coluna `URL` mostra o domínio principal (ex: `https://www.youtube.com`).
+    - A coluna `Date` mostra o dia em que as visitas ocorreram.
+    - A coluna `Visit Count` representa o **total de visitas para aquele domínio naquele dia**."""
+
+def get_analysis_prompt(history_data: str, reductions: list[str] | None = None, cohort_size: int | None = None,
+                        encoding: str | None = None) -> str:
     """
     Monta o prompt detalhado para a análise do histórico de navegação.
+    `history_data` é o CSV resumido; ele é serializado no formato `encoding`
+    (por padrão, o definido em SUMMARY_ENCODING).
     """
+    encoding = encoding or encoding_service.SUMMARY_ENCODING
     # Prompt atualizado para informar a IA sobre o formato dos dados
     prompt = f"""
     **Análise de Comportamento Digital - Perfil Psicológico e de Produtividade**
 
     **Contexto:** Você é um analista de comportamento digital e psicólogo organizacional. Sua tarefa é analisar o histórico de navegação a seguir, que pertence a um usuário anônimo. Com base nos dados, você deve criar um relatório detalhado e estruturado em Markdown.
 
-    **Atenção:** Os dados a seguir foram pré-processados e agregados. Cada linha representa o total de visitas para um **domínio específico em um único dia**.
-    - A coluna `URL` mostra o domínio principal (ex: `https://www.youtube.com`).
-    - A coluna `Date` mostra o dia em que as visitas ocorreram.
-    - A coluna `Visit Count` representa o **total de visitas para aquele domínio naquele dia**.
+    {get_format_description(encoding)}
     Sua análise deve levar em conta essa estrutura de dados resumida para inferir os padrões de uso.
+    {get_reduction_note(reductions, encoding)}
+    {get_cohort_note(cohort_size)}
 
     **Dados do Histórico de Navegação (Resumido por Dia):**
     ```
-    {history_data}
+    {encoding_service.encode(history_data, encoding)}
     ```
 
     **Estrutura do Relatório Solicitado:**
@@ -72,17 +204,256 @@ def get_analysis_prompt(history_data: str) -> str:
     """
     return prompt
 
-def generate_analysis(history_data: str) -> str:
+def prompt_overhead_tokens() -> int:
+    """
+    Estima os tokens do prompt sem os dados do histórico.
+    """
+    return _prompt_overhead_tokens(encoding_service.SUMMARY_ENCODING)
+
+@functools.lru_cache(maxsize=None)
+def _prompt_overhead_tokens(encoding: str) -> int:
+    # O modelo do prompt é fixo por formato; basta montá-lo uma vez
+    return budget_service.estimate_tokens(get_analysis_prompt("", reductions=["placeholder"], encoding=encoding))
+
+def warm_up() -> None:
+    """
+    Cria o cliente do Gemini e monta o modelo do prompt antes da primeira análise.
+    """
+    get_model()
+    prompt_overhead_tokens()
+
+def build_prompt(history_data: str, reductions: list[str] | None = None, cohort_size: int | None = None) -> str:
+    """
+    Monta o prompt final, registrando o tempo de montagem e o tamanho estimado em tokens.
+    """
+    with metrics_service.timed("prompt_assembly"):
+        prompt = get_analysis_prompt(history_data, reductions, cohort_size)
+    metrics_service.PROMPT_TOKENS.observe(budget_service.estimate_tokens(prompt))
+    return prompt
+
+def _cache_key(history_data: str, reductions: list[str] | None, cohort_size: int | None = None) -> str:
+    extra = list(reductions or [])
+    if cohort_size:
+        extra.append(f"cohort:{cohort_size}")
+    if encoding_service.SUMMARY_ENCODING != 'csv':
+        extra.append(f"encoding:{encoding_service.SUMMARY_ENCODING}")
+    return cache_service.make_key(history_data, PROMPT_VERSION, *extra)
+
+def generate_analysis(history_data: str, reductions: list[str] | None = None) -> str:
     """
     Envia o prompt para a API Gemini e retorna a análise.
     """
+    cache_key = _cache_key(history_data, reductions)
+    cached = analysis_cache.get(cache_key)
+    if cached is not None:
+        metrics_service.GEMINI_CALLS.inc(outcome="cache_hit")
+        return cached
+
+    model = get_model()
     if not model:
         return "Erro: A API do Google Gemini não foi configurada corretamente. Verifique a chave da API."
 
-    prompt = get_analysis_prompt(history_data)
+    prompt = build_prompt(history_data, reductions)
 
     try:
-        response = model.generate_content(prompt)
+        with metrics_service.timed("gemini_round_trip"):
+            response = model.generate_content(prompt)
+        metrics_service.GEMINI_CALLS.inc(outcome="ok")
+        analysis_cache.set(cache_key, response.text)
         return response.text
     except Exception as e:
+        metrics_service.GEMINI_CALLS.inc(outcome="error")
         return f"Ocorreu um erro ao gerar a análise: {e}"
+
+# --- Caminho assíncrono ---
+
+_semaphore: asyncio.Semaphore | None = None
+_waiting = 0
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+    return _semaphore
+
+@contextlib.asynccontextmanager
+async def _model_slot():
+    """
+    Reserva uma das vagas de chamada ao Gemini, recusando quando a fila está cheia.
+    """
+    global _waiting
+
+    semaphore = _get_semaphore()
+    if semaphore.locked() and _waiting >= GEMINI_MAX_QUEUE:
+        metrics_service.GEMINI_CALLS.inc(outcome="overloaded")
+        raise GeminiOverloadedError("Muitas análises em andamento. Tente novamente em instantes.")
+
+    _waiting += 1
+    try:
+        await semaphore.acquire()
+    finally:
+        _waiting -= 1
+
+    try:
+        yield
+    finally:
+        semaphore.release()
+
+def _status_code(error: Exception) -> int | None:
+    """
+    Retorna o código HTTP de um erro da API (google.api_core usa o atributo `code`).
+    """
+    code = getattr(error, 'code', None)
+    try:
+        return int(code)
+    except (TypeError, ValueError):
+        return None
+
+def _is_retryable(error: Exception) -> bool:
+    return isinstance(error, asyncio.TimeoutError) or _status_code(error) in RETRYABLE_STATUS
+
+async def _wait_before_retry(attempt: int, error: Exception) -> None:
+    delay = GEMINI_RETRY_BASE_SECONDS * (2 ** attempt)
+    delay += random.uniform(0, GEMINI_RETRY_BASE_SECONDS)
+    print(f"Gemini indisponível ({error!r}). Nova tentativa em {delay:.1f}s...")
+    await asyncio.sleep(delay)
+
+def _final_error(error: Exception) -> Exception:
+    """
+    Converte o último erro após esgotar as tentativas no erro exposto à API.
+    """
+    if _status_code(error) == RATE_LIMIT_STATUS:
+        return GeminiRateLimitError(str(error))
+    if isinstance(error, asyncio.TimeoutError):
+        return TimeoutError(f"Sem resposta do Gemini após {GEMINI_TIMEOUT_SECONDS:.0f}s.")
+    return error
+
+async def _call_model(prompt: str):
+    if hasattr(model, 'generate_content_async'):
+        return await model.generate_content_async(prompt)
+    # Modelos sem interface assíncrona rodam em uma thread para não travar o event loop
+    return await asyncio.to_thread(model.generate_content, prompt)
+
+async def _stream_model(prompt: str):
+    """
+    Produz o texto gerado pelo modelo em partes, usando o modo streaming da API.
+    """
+    if not hasattr(model, 'generate_content_async'):
+        response = await asyncio.wait_for(asyncio.to_thread(model.generate_content, prompt), timeout=GEMINI_TIMEOUT_SECONDS)
+        yield response.text
+        return
+
+    response = await asyncio.wait_for(model.generate_content_async(prompt, stream=True), timeout=GEMINI_TIMEOUT_SECONDS)
+    chunks = response.__aiter__()
+    while True:
+        try:
+            chunk = await asyncio.wait_for(chunks.__anext__(), timeout=GEMINI_TIMEOUT_SECONDS)
+        except StopAsyncIteration:
+            return
+        if chunk.text:
+            yield chunk.text
+
+async def _generate_with_retries(prompt: str) -> str:
+    """
+    Chama o modelo com timeout por tentativa e novas tentativas com backoff
+    exponencial em caso de limite de requisições ou erros temporários.
+    """
+    for attempt in range(GEMINI_MAX_RETRIES + 1):
+        try:
+            response = await asyncio.wait_for(_call_model(prompt), timeout=GEMINI_TIMEOUT_SECONDS)
+            return response.text
+        except Exception as e:
+            if not _is_retryable(e):
+                raise
+            if attempt == GEMINI_MAX_RETRIES:
+                raise _final_error(e)
+            await _wait_before_retry(attempt, e)
+
+async def _stream_with_retries(prompt: str):
+    """
+    Igual a _generate_with_retries, mas em streaming. Só há nova tentativa
+    enquanto nenhuma parte da resposta foi entregue.
+    """
+    for attempt in range(GEMINI_MAX_RETRIES + 1):
+        started = False
+        try:
+            async for text in _stream_model(prompt):
+                started = True
+                yield text
+            return
+        except Exception as e:
+            if started or not _is_retryable(e):
+                raise
+            if attempt == GEMINI_MAX_RETRIES:
+                raise _final_error(e)
+            await _wait_before_retry(attempt, e)
+
+async def generate_analysis_async(history_data: str, reductions: list[str] | None = None,
+                                  cohort_size: int | None = None) -> str:
+    """
+    Versão assíncrona de generate_analysis, com limite de chamadas simultâneas.
+    Com `cohort_size`, os dados são tratados como a soma dos históricos de uma equipe.
+    Lança GeminiOverloadedError quando a fila de espera está cheia e
+    GeminiRateLimitError quando o limite de requisições persiste.
+    """
+    cache_key = _cache_key(history_data, reductions, cohort_size)
+    cached = analysis_cache.get(cache_key)
+    if cached is not None:
+        metrics_service.GEMINI_CALLS.inc(outcome="cache_hit")
+        return cached
+
+    if not await _get_model_async():
+        return "Erro: A API do Google Gemini não foi configurada corretamente. Verifique a chave da API."
+
+    async with _model_slot():
+        prompt = build_prompt(history_data, reductions, cohort_size)
+        try:
+            with metrics_service.timed("gemini_round_trip"):
+                analysis = await _generate_with_retries(prompt)
+            metrics_service.GEMINI_CALLS.inc(outcome="ok")
+            analysis_cache.set(cache_key, analysis)
+            return analysis
+        except GeminiRateLimitError:
+            metrics_service.GEMINI_CALLS.inc(outcome="rate_limited")
+            raise
+        except Exception as e:
+            metrics_service.GEMINI_CALLS.inc(outcome="error")
+            return f"Ocorreu um erro ao gerar a análise: {e}"
+
+async def stream_analysis(history_data: str, reductions: list[str] | None = None):
+    """
+    Gera a análise em streaming, produzindo o relatório Markdown em partes
+    conforme o modelo responde. Segue os mesmos limites de generate_analysis_async.
+    """
+    cache_key = _cache_key(history_data, reductions)
+    cached = analysis_cache.get(cache_key)
+    if cached is not None:
+        metrics_service.GEMINI_CALLS.inc(outcome="cache_hit")
+        yield cached
+        return
+
+    if not await _get_model_async():
+        yield "Erro: A API do Google Gemini não foi configurada corretamente. Verifique a chave da API."
+        return
+
+    async with _model_slot():
+        prompt = build_prompt(history_data, reductions)
+        parts = []
+        start = time.perf_counter()
+        try:
+            async for text in _stream_with_retries(prompt):
+                if not parts:
+                    # Tempo até a primeira parte: o que o usuário percebe como espera
+                    metrics_service.STAGE_SECONDS.observe(time.perf_counter() - start, stage="gemini_first_chunk")
+                parts.append(text)
+                yield text
+        except GeminiRateLimitError:
+            metrics_service.GEMINI_CALLS.inc(outcome="rate_limited")
+            raise
+        except Exception as e:
+            metrics_service.GEMINI_CALLS.inc(outcome="error")
+            yield f"\n\nOcorreu um erro ao gerar a análise: {e}"
+            return
+        metrics_service.STAGE_SECONDS.observe(time.perf_counter() - start, stage="gemini_round_trip")
+        metrics_service.GEMINI_CALLS.inc(outcome="ok")
+        analysis_cache.set(cache_key, ''.join(parts))
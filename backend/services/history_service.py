@@ -1,6 +1,60 @@
-import pandas as pd
+from __future__ import annotations
+
 from urllib.parse import urlparse
+from datetime import datetime
+from functools import lru_cache
+import codecs
 import io
+import os
+import time
+import zlib
+from typing import TYPE_CHECKING
+
+from . import disc_service
+from . import metrics_service
+
+# O pandas é importado dentro das funções que o usam: a importação leva cerca
+# de meio segundo e atrasaria a subida do servidor (veja STARTUP_WARMUP)
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Quantidade de linhas acumuladas antes de cada agregação parcial.
+# Limita a memória usada pelo DataFrame temporário de cada lote.
+BATCH_ROWS = int(os.environ.get("HISTORY_BATCH_ROWS", "50000"))
+
+# Tamanho dos blocos lidos ao processar um conteúdo já carregado em memória.
+CHUNK_SIZE = 1024 * 1024
+
+# Assinaturas (magic bytes) dos formatos compactados aceitos no upload
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+# Prefixo da URL que determina o domínio: esquema + "//" + netloc.
+# Tudo depois do primeiro '/', '?' ou '#' do netloc é irrelevante para get_hostname.
+URL_PREFIX_PATTERN = r'^([^/?#]*(?://[^/?#]*)?)'
+
+# Datas ISO 8601 (ex: 2024-05-01T12:00:00.000Z): o dia são os 10 primeiros caracteres.
+ISO_DATE_PATTERN = r'^\d{4}-\d{2}-\d{2}(?:[T ]|$)'
+ISO_DAY_PATTERN = r'^\s*(\d{4}-\d{2}-\d{2})(?:[T ]|\s*$)'
+
+# Formatos conhecidos de exportação além do ISO, testados uma vez por arquivo.
+# Com dia e mês ambíguos, o mês vem primeiro, como na inferência padrão do pandas.
+TIMESTAMP_FORMATS = [
+    '%m/%d/%Y %H:%M:%S',
+    '%d/%m/%Y %H:%M:%S',
+    '%m/%d/%Y %H:%M',
+    '%d/%m/%Y %H:%M',
+    '%m/%d/%Y %I:%M:%S %p',
+    '%m/%d/%Y',
+    '%d/%m/%Y',
+]
+
+# Formato com o dia primeiro equivalente a cada formato com o mês primeiro
+DAY_FIRST_FORMATS = {
+    '%m/%d/%Y %H:%M:%S': '%d/%m/%Y %H:%M:%S',
+    '%m/%d/%Y %H:%M': '%d/%m/%Y %H:%M',
+    '%m/%d/%Y': '%d/%m/%Y',
+}
 
 def get_hostname(url: str) -> str:
     """
@@ -16,63 +70,444 @@ def get_hostname(url: str) -> str:
     except Exception:
         return 'invalid_or_other'
 
-def summarize_history_data(csv_content: str) -> str:
+@lru_cache(maxsize=65536)
+def _hostname_for_prefix(prefix: str) -> str:
+    return get_hostname(prefix)
+
+def extract_hostnames(urls: pd.Series) -> pd.Series:
     """
-    Recebe o conteúdo de um CSV de histórico como string,
-    agrega os dados por domínio e data, e retorna um novo CSV como string.
-    Esta versão é robusta contra vírgulas nas URLs.
+    Versão vetorizada de get_hostname para uma coluna de URLs.
+    Extrai o prefixo (esquema + netloc) de cada URL e resolve cada prefixo
+    distinto uma única vez, com cache entre lotes e arquivos.
     """
-    if not csv_content:
+    import pandas as pd
+
+    prefixes = urls.str.extract(URL_PREFIX_PATTERN, expand=False)
+    codes, uniques = pd.factorize(prefixes)
+    hostnames = pd.Index([_hostname_for_prefix(prefix) for prefix in uniques])
+    return pd.Series(hostnames.take(codes), index=urls.index)
+
+def _matches_format(values, fmt: str) -> bool:
+    try:
+        for value in values:
+            datetime.strptime(value, fmt)
+    except ValueError:
+        return False
+    return True
+
+def detect_timestamp_format(sample: pd.Series) -> str | None:
+    """
+    Detecta o formato das datas de uma exportação a partir de uma amostra.
+    Retorna 'iso' para datas ISO 8601, um formato strptime conhecido,
+    ou None quando nenhum formato fixo se aplica.
+
+    Os primeiros 100 valores escolhem o formato. Se eles servem tanto com o
+    mês quanto com o dia primeiro (todos os dias até 12), a amostra inteira
+    decide: o dia vem primeiro só se essa ordem interpretar mais valores.
+    """
+    import pandas as pd
+
+    values = sample.dropna().str.strip()
+    values = values[values != '']
+    head = values.head(100)
+    if head.empty:
+        return None
+    if head.str.match(ISO_DATE_PATTERN).all():
+        return 'iso'
+    for fmt in TIMESTAMP_FORMATS:
+        if not _matches_format(head, fmt):
+            continue
+        day_first = DAY_FIRST_FORMATS.get(fmt)
+        if day_first is not None and _matches_format(head, day_first):
+            month_first_parsed = pd.to_datetime(values, format=fmt, errors='coerce').notna().sum()
+            day_first_parsed = pd.to_datetime(values, format=day_first, errors='coerce').notna().sum()
+            if day_first_parsed > month_first_parsed:
+                return day_first
+        return fmt
+    return None
+
+def parse_visit_dates(values: pd.Series, fmt: str | None) -> pd.Series:
+    """
+    Converte a coluna 'Last Visited' em datas no formato YYYY-MM-DD.
+    Valores que não puderem ser interpretados resultam em NaN.
+    """
+    import pandas as pd
+
+    if fmt == 'iso':
+        days = values.str.extract(ISO_DAY_PATTERN, expand=False)
+        # Linhas fora do padrão ISO (ex: em lotes seguintes) usam a inferência genérica do pandas
+        fallback = days.isna() & values.notna()
+        # O padrão aceita datas impossíveis (ex: 2024-02-30), descartadas aqui
+        days = days.where(pd.to_datetime(days, format='%Y-%m-%d', errors='coerce').notna())
+        if fallback.any():
+            parsed = pd.to_datetime(values[fallback].str.strip(), errors='coerce')
+            days[fallback] = parsed.dt.strftime('%Y-%m-%d')
+        return days
+
+    values = values.str.strip()
+    if fmt:
+        parsed = pd.to_datetime(values, format=fmt, errors='coerce')
+        # Linhas fora do formato detectado usam a inferência genérica do pandas,
+        # mantendo a ordem de dia e mês do formato detectado
+        fallback = parsed.isna() & values.notna()
+        if fallback.any():
+            parsed[fallback] = pd.to_datetime(values[fallback], errors='coerce', dayfirst=fmt.startswith('%d'))
+    else:
+        parsed = pd.to_datetime(values, errors='coerce')
+    return parsed.dt.strftime('%Y-%m-%d')
+
+class HistoryAggregator:
+    """
+    Agrega um histórico de navegação recebido em blocos (chunks).
+
+    Cada bloco é dividido em linhas, que são processadas em lotes e somadas
+    a um agregado (domínio, data) -> visitas. A memória usada depende do número
+    de pares domínio/dia distintos, e não do tamanho do arquivo. Na mesma
+    passada, os scores DISC são acumulados a partir das URLs completas.
+
+    Com `baseline` (veja store_service.IncrementalBaseline), apenas as linhas a
+    partir de `baseline.min_date` são agregadas, contando só as visitas novas
+    de cada URL desde o envio anterior.
+    """
+
+    def __init__(self, batch_rows: int = BATCH_ROWS, baseline=None):
+        self.batch_rows = batch_rows
+        self.baseline = baseline
+        self.counts: dict[tuple[str, str], int] = {}
+        self.disc_scores = disc_service.empty_scores()
+        self.rows_parsed = 0
+        self.rows_dropped = 0
+        self.rows_skipped = 0
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._pending = ''
+        self._line_number = 0
+        self._batch: list[list[str]] = []
+        self._timestamp_format: str | None = None
+        self._format_detected = False
+        self._flush_seconds = 0.0
+        # Com baseline e datas ISO, linhas antigas são descartadas já na divisão do CSV
+        self._skip_before: str | None = None
+
+    def feed(self, chunk: str | bytes) -> None:
+        """
+        Adiciona um bloco do CSV (texto ou bytes UTF-8) ao agregado.
+        """
+        if isinstance(chunk, bytes):
+            chunk = self._decoder.decode(chunk)
+        if not chunk:
+            return
+
+        start = time.perf_counter()
+        flush_seconds = self._flush_seconds
+        lines = (self._pending + chunk).split('\n')
+        # A última parte pode ser uma linha incompleta; guarda para o próximo bloco.
+        self._pending = lines.pop()
+        for line in lines:
+            self._add_line(line)
+        # O tempo dos lotes processados durante o bloco é medido à parte, em _flush
+        split_seconds = time.perf_counter() - start - (self._flush_seconds - flush_seconds)
+        metrics_service.STAGE_SECONDS.observe(split_seconds, stage="csv_split")
+
+    def finish(self) -> dict[tuple[str, str], int]:
+        """
+        Processa o restante pendente e retorna o agregado final.
+        """
+        tail = self._pending + self._decoder.decode(b'', final=True)
+        self._pending = ''
+        if tail:
+            self._add_line(tail)
+        self._flush()
+        metrics_service.ROWS_PARSED.inc(self.rows_parsed)
+        metrics_service.ROWS_DROPPED.inc(self.rows_dropped)
+        return self.counts
+
+    def _add_line(self, line: str) -> None:
+        line = line.rstrip('\r')
+        if not line.strip():
+            return
+        self._line_number += 1
+        if self._line_number == 1:
+            return # Pula o cabeçalho
+
+        # rsplit(',', 2) isola a data e a contagem, deixando o resto (a URL) junto.
+        parts = line.rsplit(',', 2)
+        if len(parts) == 3:
+            if self._skip_before is not None:
+                day = parts[1].lstrip()[:10]
+                # Linhas fora do padrão ISO seguem para o lote e são interpretadas lá
+                if day < self._skip_before and day[4:5] == '-':
+                    self.rows_skipped += 1
+                    return
+            self._batch.append(parts)
+            if len(self._batch) >= self.batch_rows:
+                self._flush()
+        else:
+            self.rows_dropped += 1
+            print(f"Aviso no backend: Linha {self._line_number} ignorada por formato inesperado.")
+
+    def _flush(self) -> None:
+        if not self._batch:
+            return
+
+        start = time.perf_counter()
+        try:
+            self._aggregate_batch()
+        finally:
+            self._flush_seconds += time.perf_counter() - start
+
+    def _aggregate_batch(self) -> None:
+        import pandas as pd
+
+        with metrics_service.timed("dataframe_build"):
+            df = pd.DataFrame(self._batch, columns=['URL', 'Last Visited', 'Visit Count'])
+            self._batch = []
+            df['Visit Count'] = pd.to_numeric(df['Visit Count'], errors='coerce').fillna(0).astype(int)
+
+        with metrics_service.timed("timestamp_parsing"):
+            # O formato das datas é detectado uma única vez, no primeiro lote
+            if not self._format_detected:
+                self._timestamp_format = detect_timestamp_format(df['Last Visited'])
+                self._format_detected = True
+                if self.baseline is not None and self._timestamp_format == 'iso' and self.baseline.min_date:
+                    self._skip_before = self.baseline.min_date
+            df['Visit_Date'] = parse_visit_dates(df['Last Visited'], self._timestamp_format)
+
+        if self.baseline is not None:
+            df = self._new_visits(df)
+
+        with metrics_service.timed("disc_scoring"):
+            disc_service.add_scores(self.disc_scores, df['URL'], df['Visit Count'])
+
+        with metrics_service.timed("hostname_extraction"):
+            df['Domain'] = extract_hostnames(df['URL'])
+
+        invalid_dates = df['Visit_Date'].isna()
+        if invalid_dates.any():
+            self.rows_dropped += int(invalid_dates.sum())
+            print(f"Aviso no backend: {int(invalid_dates.sum())} linhas ignoradas por data inválida.")
+            df = df[~invalid_dates]
+
+        self.rows_parsed += len(df)
+
+        with metrics_service.timed("groupby"):
+            partial = df.groupby(['Domain', 'Visit_Date'])['Visit Count'].sum()
+            counts = self.counts
+            for key, value in partial.items():
+                counts[key] = counts.get(key, 0) + int(value)
+
+    def _new_visits(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Mantém só as linhas a partir da marca d'água do baseline, com a contagem
+        substituída pelas visitas novas de cada URL (as exportações são cumulativas).
+        """
+        baseline = self.baseline
+        # Linhas sem data válida seguem adiante para serem contadas como ignoradas
+        recent = df['Visit_Date'].isna() | (df['Visit_Date'] >= baseline.min_date)
+        skipped = int((~recent).sum())
+        df = df[recent].copy()
+
+        valid = df['Visit_Date'].notna()
+        deltas = baseline.visit_deltas(df.loc[valid, 'URL'], df.loc[valid, 'Visit Count'], df.loc[valid, 'Visit_Date'])
+        df.loc[valid, 'Visit Count'] = deltas
+        unchanged = valid & (df['Visit Count'] <= 0)
+        self.rows_skipped += skipped + int(unchanged.sum())
+        return df[~unchanged]
+
+class UnsupportedEncodingError(Exception):
+    """O arquivo enviado usa uma compactação que o servidor não consegue ler."""
+
+class CorruptedUploadError(Exception):
+    """O arquivo compactado enviado está corrompido ou incompleto."""
+
+class UploadTooLargeError(Exception):
+    """O histórico descompactado excede o limite aceito."""
+
+class StreamDecompressor:
+    """
+    Descompacta um upload recebido em blocos, detectando pelo conteúdo se o
+    arquivo é CSV puro, gzip ou zstd.
+    """
+
+    def __init__(self):
+        self.encoding: str | None = None
+        self._header = b''
+        self._decompressor = None
+
+    def decompress(self, chunk: bytes) -> bytes:
+        if self.encoding is None:
+            # Aguarda bytes suficientes para reconhecer a assinatura do arquivo
+            self._header += chunk
+            if len(self._header) < len(ZSTD_MAGIC):
+                return b''
+            chunk, self._header = self._header, b''
+            self._start(chunk)
+
+        return self._decompress(chunk)
+
+    def flush(self) -> bytes:
+        data = b''
+        if self.encoding is None:
+            chunk, self._header = self._header, b''
+            self._start(chunk)
+            data = self._decompress(chunk)
+        if self.encoding == 'gzip':
+            data += self._decompressor.flush()
+        if self._decompressor is not None and not self._decompressor.eof:
+            raise CorruptedUploadError(f"Arquivo {self.encoding} incompleto.")
+        return data
+
+    def _decompress(self, chunk: bytes) -> bytes:
+        if self._decompressor is None:
+            return chunk
+        try:
+            if self._decompressor.eof and chunk:
+                # O membro anterior terminou exatamente no fim do bloco anterior
+                self._decompressor = self._new_decompressor()
+            data = self._decompressor.decompress(chunk)
+            # Arquivos com vários membros gzip (pigz, `cat a.gz b.gz`) ou vários
+            # frames zstd: cada um é lido por um novo descompactador
+            while self._decompressor.eof and self._decompressor.unused_data:
+                rest = self._decompressor.unused_data
+                self._decompressor = self._new_decompressor()
+                data += self._decompressor.decompress(rest)
+            return data
+        except Exception as e:
+            raise CorruptedUploadError(f"Arquivo {self.encoding} inválido: {e}")
+
+    def _new_decompressor(self):
+        if self.encoding == 'gzip':
+            return zlib.decompressobj(zlib.MAX_WBITS | 16)
+        import zstandard
+        return zstandard.ZstdDecompressor().decompressobj()
+
+    def _start(self, chunk: bytes) -> None:
+        if chunk.startswith(GZIP_MAGIC):
+            self.encoding = 'gzip'
+        elif chunk.startswith(ZSTD_MAGIC):
+            self.encoding = 'zstd'
+            try:
+                import zstandard
+            except ImportError:
+                raise UnsupportedEncodingError("Arquivos zstd exigem o pacote opcional 'zstandard' no servidor.")
+        else:
+            self.encoding = 'identity'
+            return
+        self._decompressor = self._new_decompressor()
+
+def format_summary(counts: dict[tuple[str, str], int]) -> str:
+    """
+    Converte o agregado (domínio, data) -> visitas no CSV resumido enviado à IA.
+    """
+    if not counts:
         return ""
 
+    with metrics_service.timed("csv_serialization"):
+        return _format_summary(counts)
+
+def _format_summary(counts: dict[tuple[str, str], int]) -> str:
+    import pandas as pd
+
+    summary_df = pd.DataFrame(
+        [(domain, date, count) for (domain, date), count in sorted(counts.items())],
+        columns=['Domain', 'Date', 'Visit Count']
+    )
+    summary_df['URL'] = summary_df['Domain'].apply(
+        lambda domain: f"https://{domain}" if domain != 'local_files' else 'local_files'
+    )
+    summary_df = summary_df[['URL', 'Date', 'Visit Count']]
+    summary_df = summary_df.sort_values(by=['Date', 'Visit Count'], ascending=[False, False])
+
+    output_buffer = io.StringIO()
+    summary_df.to_csv(output_buffer, index=False)
+
+    return output_buffer.getvalue()
+
+def iter_text_chunks(text: str):
+    """
+    Percorre um conteúdo já carregado em memória em blocos de CHUNK_SIZE caracteres.
+    """
+    for i in range(0, len(text), CHUNK_SIZE):
+        yield text[i:i + CHUNK_SIZE]
+
+def aggregator_result(aggregator: HistoryAggregator) -> dict:
+    """
+    Finaliza o agregador e retorna o resumo CSV e os scores DISC calculados na mesma passada.
+    """
+    counts = aggregator.finish()
+    return {
+        "summary": format_summary(counts),
+        "disc_scores": disc_service.normalize_scores(aggregator.disc_scores),
+        "rows_parsed": aggregator.rows_parsed,
+        "rows_dropped": aggregator.rows_dropped,
+    }
+
+def analyze_history_data(csv_content: str) -> dict:
+    """
+    Processa o CSV de histórico uma única vez, produzindo o resumo por domínio
+    e data e os scores DISC (veja aggregator_result).
+    """
+    aggregator = HistoryAggregator()
+    for chunk in iter_text_chunks(csv_content):
+        aggregator.feed(chunk)
+    return aggregator_result(aggregator)
+
+def analyze_history_file(path: str, max_bytes: int | None = None, check=None,
+                         aggregator: HistoryAggregator | None = None) -> dict:
+    """
+    Lê um arquivo de histórico (CSV puro, gzip ou zstd) em blocos, descompactando
+    e agregando incrementalmente (veja aggregator_result). Inclui no resultado o
+    agregado, o formato detectado e o total de bytes descompactados.
+
+    `check`, se informado, é chamado antes de cada bloco e pode interromper o
+    processamento lançando uma exceção (prazo esgotado, cancelamento).
+    """
+    aggregator = aggregator or HistoryAggregator()
+    decompressor = StreamDecompressor()
+    total_bytes = 0
+    with open(path, 'rb') as history_file:
+        while True:
+            if check is not None:
+                check()
+            chunk = history_file.read(CHUNK_SIZE)
+            data = decompressor.decompress(chunk) if chunk else decompressor.flush()
+            total_bytes += len(data)
+            if max_bytes is not None and total_bytes > max_bytes:
+                raise UploadTooLargeError(f"Arquivo muito grande. O limite é de {max_bytes // (1024 * 1024)}MB descompactados.")
+            aggregator.feed(data)
+            if not chunk:
+                break
+
+    history = aggregator_result(aggregator)
+    # O agregado (domínio, data) -> visitas permite somar vários históricos (veja cohort_service)
+    history["counts"] = aggregator.counts
+    history["encoding"] = decompressor.encoding
+    history["total_bytes"] = total_bytes
+    return history
+
+def summarize_history_stream(chunks) -> str:
+    """
+    Recebe um iterável de blocos do CSV de histórico (texto ou bytes) e
+    retorna o CSV resumido por domínio e data, sem carregar o arquivo inteiro.
+    """
     try:
-        lines = csv_content.strip().split('\n')
-        if len(lines) < 2:
-            return "" # Retorna vazio se não houver dados
-
-        # Processamento manual para evitar erros de tokenização com pandas
-        data_rows = []
-        for i, line in enumerate(lines[1:], 1): # Pula o cabeçalho
-            parts = line.rsplit(',', 2)
-            if len(parts) == 3:
-                data_rows.append(parts)
-            else:
-                print(f"Aviso no backend: Linha {i+1} ignorada por formato inesperado.")
-        
-        if not data_rows:
-            return ""
-
-        # Cria o DataFrame a partir dos dados limpos
-        df = pd.DataFrame(data_rows, columns=['URL', 'Last Visited', 'Visit Count'])
-        df['Visit Count'] = pd.to_numeric(df['Visit Count'], errors='coerce').fillna(0).astype(int)
-
-        # Continua com a lógica de sumarização
-        df['Domain'] = df['URL'].apply(get_hostname)
-        df['Last Visited'] = pd.to_datetime(df['Last Visited'])
-        df['Visit_Date'] = df['Last Visited'].dt.date
-
-        aggregated_data = df.groupby(['Domain', 'Visit_Date']).agg(
-            Daily_Visit_Count=('Visit Count', 'sum')
-        ).reset_index()
-
-        aggregated_data['URL'] = aggregated_data['Domain'].apply(
-            lambda domain: f"https://{domain}" if domain != 'local_files' else 'local_files'
-        )
-        
-        summary_df = aggregated_data[['URL', 'Visit_Date', 'Daily_Visit_Count']]
-        summary_df = summary_df.rename(columns={
-            'Visit_Date': 'Date',
-            'Daily_Visit_Count': 'Visit Count'
-        })
-
-        summary_df = summary_df.sort_values(by=['Date', 'Visit Count'], ascending=[False, False])
-        
-        output_buffer = io.StringIO()
-        summary_df.to_csv(output_buffer, index=False)
-        
-        return output_buffer.getvalue()
+        aggregator = HistoryAggregator()
+        for chunk in chunks:
+            aggregator.feed(chunk)
+        return format_summary(aggregator.finish())
 
     except Exception as e:
         print(f"Erro CRÍTICO ao processar o histórico no backend: {e}")
         # Em caso de um erro inesperado, retorna uma string vazia para não sobrecarregar a IA
         return "Erro ao processar dados do histórico."
+
+def summarize_history_data(csv_content: str) -> str:
+    """
+    Recebe o conteúdo de um CSV de histórico como string,
+    agrega os dados por domínio e data, e retorna um novo CSV como string.
+    Esta versão é robusta contra vírgulas nas URLs.
+    """
+    if not csv_content:
+        return ""
+
+    # Percorre o conteúdo em blocos para não criar listas com todas as linhas
+    return summarize_history_stream(iter_text_chunks(csv_content))
@@ -0,0 +1,182 @@
+import asyncio
+import os
+import time
+import uuid
+
+from . import gemini_service
+
+# Configuração dos jobs de análise (configurável via .env)
+JOB_TTL_SECONDS = float(os.environ.get("JOB_TTL_SECONDS", "3600"))
+MAX_ACTIVE_JOBS = int(os.environ.get("MAX_ACTIVE_JOBS", "32"))
+MAX_STORED_JOBS = int(os.environ.get("MAX_STORED_JOBS", "1000"))
+
+class JobQueueFullError(Exception):
+    """Há jobs demais em andamento; novos envios devem ser recusados."""
+
+class JobFailedError(Exception):
+    """O resumo do histórico falhou; o job termina com `status_code`."""
+
+    def __init__(self, detail: str, status_code: int):
+        super().__init__(detail)
+        self.status_code = status_code
+
+class Job:
+    """
+    Uma análise em andamento: primeiro o histórico é resumido ("summarizing"),
+    depois a IA gera o relatório ("running"). O texto gerado é acumulado em
+    partes, que podem ser acompanhadas em tempo real por vários leitores com `follow`.
+    """
+
+    def __init__(self, filename: str):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.reductions: list[str] = []
+        self.disc_scores: dict[str, float] | None = None
+        self.summarized = False
+        self.status = "summarizing"
+        self.chunks: list[str] = []
+        self.error: str | None = None
+        self.status_code: int | None = None
+        self.created_at = time.time()
+        self.finished_at: float | None = None
+        self._condition = asyncio.Condition()
+        self._task: asyncio.Task | None = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "error")
+
+    @property
+    def analysis(self) -> str:
+        return ''.join(self.chunks)
+
+    def summary(self) -> dict:
+        """
+        O que fica disponível assim que o histórico é resumido, antes da análise da IA.
+        """
+        return {"disc_scores": self.disc_scores, "reductions": self.reductions}
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "filename": self.filename,
+            "status": self.status,
+            "disc_scores": self.disc_scores,
+            "reductions": self.reductions,
+            "analysis": self.analysis if self.status == "done" else None,
+            "error": self.error,
+        }
+
+    async def _summarized(self, history: dict) -> None:
+        async with self._condition:
+            self.reductions = history.get("reductions", [])
+            self.disc_scores = history.get("disc_scores")
+            self.summarized = True
+            self.status = "running"
+            self._condition.notify_all()
+
+    async def _append(self, text: str) -> None:
+        async with self._condition:
+            self.chunks.append(text)
+            self._condition.notify_all()
+
+    async def _finish(self, error: str | None = None, status_code: int | None = None) -> None:
+        async with self._condition:
+            self.status = "error" if error else "done"
+            self.error = error
+            self.status_code = status_code
+            self.finished_at = time.time()
+            self._condition.notify_all()
+
+    async def follow(self, heartbeat_seconds: float = 15.0):
+        """
+        Produz os eventos do job à medida que acontecem, até o fim: ("summary", dados)
+        quando o histórico termina de ser resumido (veja `summary`) e ("chunk", texto)
+        para cada parte gerada pela IA. Produz None a cada `heartbeat_seconds` sem
+        novidades, para manter a conexão viva.
+        """
+        index = 0
+        summary_sent = False
+        while True:
+            async with self._condition:
+                try:
+                    await asyncio.wait_for(
+                        self._condition.wait_for(
+                            lambda: (self.summarized and not summary_sent) or len(self.chunks) > index or self.finished
+                        ),
+                        timeout=heartbeat_seconds
+                    )
+                except asyncio.TimeoutError:
+                    events = None
+                else:
+                    events = []
+                    if self.summarized and not summary_sent:
+                        summary_sent = True
+                        events.append(("summary", self.summary()))
+                    events.extend(("chunk", chunk) for chunk in self.chunks[index:])
+                    index = len(self.chunks)
+                finished = self.finished
+
+            if events is None:
+                yield None
+                continue
+            for event in events:
+                yield event
+            if finished and index == len(self.chunks):
+                return
+
+_jobs: dict[str, Job] = {}
+
+def _prune() -> None:
+    """
+    Remove jobs concluídos que expiraram ou que excedem o limite armazenado.
+    """
+    now = time.time()
+    for job_id, job in list(_jobs.items()):
+        if job.finished and now - job.finished_at > JOB_TTL_SECONDS:
+            del _jobs[job_id]
+
+    finished = sorted((job for job in _jobs.values() if job.finished), key=lambda job: job.finished_at)
+    excess = len(_jobs) - MAX_STORED_JOBS
+    for job in finished[:max(excess, 0)]:
+        del _jobs[job.id]
+
+def get_job(job_id: str) -> Job | None:
+    return _jobs.get(job_id)
+
+def create_job(filename: str, summarize) -> Job:
+    """
+    Cria um job que resume o histórico e gera a análise em segundo plano.
+    `summarize` é chamada dentro do job e retorna o resultado do processamento
+    do histórico (resumo, reduções e scores DISC); falhas esperadas do resumo
+    são informadas com JobFailedError. Precisa ser chamado dentro do event loop
+    da aplicação.
+    """
+    _prune()
+    active = sum(1 for job in _jobs.values() if not job.finished)
+    if active >= MAX_ACTIVE_JOBS:
+        raise JobQueueFullError("Muitas análises em andamento. Tente novamente em instantes.")
+
+    job = Job(filename)
+    _jobs[job.id] = job
+    job._task = asyncio.create_task(_run(job, summarize))
+    return job
+
+async def _run(job: Job, summarize) -> None:
+    try:
+        history = await summarize()
+        await job._summarized(history)
+        async for text in gemini_service.stream_analysis(history["summary"], job.reductions):
+            await job._append(text)
+    except JobFailedError as e:
+        await job._finish(str(e), e.status_code)
+    except gemini_service.GeminiOverloadedError as e:
+        await job._finish(str(e), 503)
+    except gemini_service.GeminiRateLimitError as e:
+        await job._finish(f"Limite de requisições da IA atingido: {e}", 429)
+    except Exception as e:
+        print(f"Erro no job {job.id}: {e}")
+        await job._finish(f"Ocorreu um erro inesperado no servidor: {e}", 500)
+    else:
+        await job._finish()
+        print(f"Análise do job {job.id} gerada com sucesso.")
@@ -0,0 +1,194 @@
+import bisect
+import contextlib
+import threading
+import time
+
+# Prefixo de todas as métricas exportadas em /metrics
+METRIC_PREFIX = "socialprofiler"
+
+# Limites dos histogramas de latência, em segundos
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# Limites dos histogramas de tamanho (linhas, tokens)
+SIZE_BUCKETS = (10, 100, 1_000, 10_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 10_000_000)
+
+def _format_labels(labels: tuple[tuple[str, str], ...], extra: str = "") -> str:
+    parts = [f'{key}="{value}"' for key, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Contador monotônico, com rótulos opcionais."""
+
+    def __init__(self, name: str, description: str):
+        self.name = f"{METRIC_PREFIX}_{name}"
+        self.description = description
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def export(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+    def merge(self, values: dict) -> None:
+        with self._lock:
+            for key, value in values.items():
+                self._values[key] = self._values.get(key, 0) + value
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+class Histogram:
+    """Histograma cumulativo no formato do Prometheus, com rótulos opcionais."""
+
+    def __init__(self, name: str, description: str, buckets: tuple = LATENCY_BUCKETS):
+        self.name = f"{METRIC_PREFIX}_{name}"
+        self.description = description
+        self.buckets = tuple(buckets)
+        self._series: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Contagem por faixa (a última é +Inf), soma e total de observações
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def export(self) -> dict:
+        with self._lock:
+            return {key: [list(counts), total, count] for key, (counts, total, count) in self._series.items()}
+
+    def merge(self, series: dict) -> None:
+        with self._lock:
+            for key, (counts, total, count) in series.items():
+                current = self._series.get(key)
+                if current is None:
+                    self._series[key] = [list(counts), total, count]
+                    continue
+                current[0] = [a + b for a, b in zip(current[0], counts)]
+                current[1] += total
+                current[2] += count
+
+    def reset(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = 'le="' + _format_value(bound) + '"'
+                    lines.append(f"{self.name}_bucket{_format_labels(labels, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+class Gauge:
+    """
+    Valor lido no momento da exportação, a partir de uma função.
+    Com `metric_type="counter"`, exporta contadores mantidos por outros módulos.
+    """
+
+    def __init__(self, name: str, description: str, read, metric_type: str = "gauge"):
+        self.name = f"{METRIC_PREFIX}_{name}"
+        self.description = description
+        self.metric_type = metric_type
+        self._read = read
+
+    def render(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} {self.metric_type}",
+            f"{self.name} {_format_value(self._read())}",
+        ]
+
+_registry: list = []
+
+def _register(metric):
+    _registry.append(metric)
+    return metric
+
+def register_gauge(name: str, description: str, read, metric_type: str = "gauge") -> Gauge:
+    return _register(Gauge(name, description, read, metric_type))
+
+# --- Métricas da aplicação ---
+
+STAGE_SECONDS = _register(Histogram("stage_duration_seconds", "Duração de cada etapa do processamento."))
+REQUEST_SECONDS = _register(Histogram("http_request_duration_seconds", "Duração das requisições HTTP por rota e status."))
+ROWS_PARSED = _register(Counter("rows_parsed_total", "Linhas do histórico processadas."))
+ROWS_DROPPED = _register(Counter("rows_dropped_total", "Linhas do histórico ignoradas (formato ou data inválidos)."))
+SUMMARY_ROWS = _register(Histogram("summary_rows", "Linhas do histórico resumido enviado à IA.", SIZE_BUCKETS))
+PROMPT_TOKENS = _register(Histogram("prompt_tokens", "Tokens estimados de cada prompt enviado à IA.", SIZE_BUCKETS))
+GEMINI_CALLS = _register(Counter("gemini_calls_total", "Chamadas ao Gemini por resultado."))
+
+@contextlib.contextmanager
+def timed(stage: str):
+    """
+    Mede a duração de um bloco e registra no histograma de etapas.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+
+def export_state() -> dict:
+    """
+    Retorna os valores acumulados dos contadores e histogramas, para serem
+    enviados de um processo de trabalho ao processo principal (veja merge_state).
+    """
+    return {metric.name: metric.export() for metric in _registry if hasattr(metric, "export")}
+
+def merge_state(state: dict) -> None:
+    """
+    Soma às métricas deste processo os valores exportados por outro processo.
+    """
+    metrics = {metric.name: metric for metric in _registry}
+    for name, values in state.items():
+        metric = metrics.get(name)
+        if metric is not None:
+            metric.merge(values)
+
+def reset() -> None:
+    """
+    Zera os contadores e histogramas (usado nos processos de trabalho antes de cada tarefa).
+    """
+    for metric in _registry:
+        if hasattr(metric, "reset"):
+            metric.reset()
+
+def render() -> str:
+    """
+    Exporta todas as métricas no formato de texto do Prometheus.
+    """
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
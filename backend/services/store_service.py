@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import hmac
+import json
+import os
+import sqlite3
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING
+
+from . import disc_service
+from . import history_service
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Caminho do banco SQLite com os agregados diários de cada usuário; vazio desativa
+# a análise incremental e todo envio é processado do zero
+HISTORY_STORE_DB = os.environ.get("HISTORY_STORE_DB", "")
+# Segredo do servidor usado para derivar o identificador gravado a partir da chave do usuário
+HISTORY_STORE_SECRET = os.environ.get("HISTORY_STORE_SECRET", "")
+if HISTORY_STORE_DB and not HISTORY_STORE_SECRET:
+    print("HISTORY_STORE_DB definido sem HISTORY_STORE_SECRET; a análise incremental fica desativada.")
+# Tempo de espera pelo bloqueio de escrita do SQLite
+STORE_BUSY_TIMEOUT_SECONDS = 30
+
+# URLs consultadas por vez ao buscar as contagens anteriores
+LOOKUP_CHUNK = 500
+
+# A chave do usuário é a única credencial para ler e apagar os dados guardados:
+# precisa ser um segredo aleatório (ex: secrets.token_urlsafe(32)), não um e-mail
+USER_KEY_MIN_LENGTH = 32
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history_users (
+    user_id TEXT PRIMARY KEY,
+    watermark TEXT NOT NULL,
+    disc_scores TEXT NOT NULL,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS history_daily (
+    user_id TEXT NOT NULL,
+    domain TEXT NOT NULL,
+    date TEXT NOT NULL,
+    visit_count INTEGER NOT NULL,
+    PRIMARY KEY (user_id, domain, date)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS history_urls (
+    user_id TEXT NOT NULL,
+    url_hash BLOB NOT NULL,
+    visit_count INTEGER NOT NULL,
+    PRIMARY KEY (user_id, url_hash)
+) WITHOUT ROWID;
+"""
+
+class StoreConflictError(Exception):
+    """Outro envio do mesmo usuário foi gravado durante o processamento."""
+
+class InvalidUserKeyError(ValueError):
+    """A chave do usuário não é um segredo aleatório longo o bastante."""
+
+def enabled() -> bool:
+    return bool(HISTORY_STORE_DB and HISTORY_STORE_SECRET)
+
+def check_user_key(user_key: str) -> None:
+    if len(user_key) < USER_KEY_MIN_LENGTH or '@' in user_key:
+        raise InvalidUserKeyError(
+            f"A chave do usuário deve ser um segredo aleatório com pelo menos {USER_KEY_MIN_LENGTH} "
+            "caracteres (ex: gerado por secrets.token_urlsafe(32)), e não um e-mail."
+        )
+
+def user_id(user_key: str) -> str:
+    """
+    Identificador gravado no banco: HMAC da chave do usuário com HISTORY_STORE_SECRET.
+    A chave não é guardada e não pode ser testada contra o banco sem o segredo.
+    """
+    check_user_key(user_key)
+    return hmac.new(HISTORY_STORE_SECRET.encode('utf-8'), user_key.encode('utf-8'), hashlib.sha256).hexdigest()
+
+def _today() -> str:
+    return datetime.now(timezone.utc).date().isoformat()
+
+def _url_hash(url: str) -> bytes:
+    return hashlib.blake2b(url.encode('utf-8'), digest_size=16).digest()
+
+@contextlib.contextmanager
+def _connect():
+    db = sqlite3.connect(HISTORY_STORE_DB, timeout=STORE_BUSY_TIMEOUT_SECONDS, isolation_level=None)
+    try:
+        db.execute("PRAGMA journal_mode=WAL")
+        # Com WAL, NORMAL ainda garante a consistência do banco após uma queda
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.executescript(SCHEMA)
+        yield db
+    finally:
+        db.close()
+
+class IncrementalBaseline:
+    """
+    Estado do envio anterior de um usuário, usado pelo HistoryAggregator.
+
+    As exportações das extensões são cumulativas: cada linha traz o total de
+    visitas da URL e a data da última visita. Por isso, além da marca d'água
+    (a data mais recente já processada), guardamos a última contagem de cada
+    URL (como hash) e somamos apenas a diferença. Sem isso, uma URL visitada
+    de novo teria todas as visitas antigas contadas outra vez na nova data.
+    Linhas repetidas de uma URL no mesmo envio são somadas antes da diferença.
+
+    A marca d'água só avança com datas válidas até o dia do envio (UTC): uma
+    data futura faria todos os envios seguintes serem ignorados.
+    """
+
+    def __init__(self, db: sqlite3.Connection, user_id: str):
+        self.user_id = user_id
+        self._db = db
+        row = db.execute(
+            "SELECT watermark, disc_scores, version FROM history_users WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        self.today = _today()
+        if row is None:
+            # '' é menor que qualquer data: no primeiro envio tudo é processado
+            self.min_date, self.disc_scores, self.version = '', disc_service.empty_scores(), 0
+        else:
+            self.min_date, self.disc_scores, self.version = row[0], json.loads(row[1]), row[2]
+            if self.min_date > self.today:
+                # Marca d'água no futuro (gravada antes desta verificação): processa
+                # tudo de novo; as contagens por URL evitam contar visitas duas vezes
+                self.min_date = ''
+        self.watermark = self.min_date
+        # Visitas de cada URL neste envio e as contagens guardadas no envio anterior
+        self.url_counts: dict[bytes, int] = {}
+        self._stored: dict[bytes, int] = {}
+
+    def visit_deltas(self, urls: pd.Series, visit_counts: pd.Series, dates: pd.Series) -> pd.Series:
+        """
+        Retorna as visitas novas de cada URL desde o envio anterior.
+        """
+        import pandas as pd
+
+        hashes = [_url_hash(url) for url in urls]
+        if self.version:
+            # No primeiro envio do usuário não há contagens anteriores a buscar
+            self._stored.update(self._lookup([h for h in set(hashes) if h not in self.url_counts]))
+
+        deltas = []
+        stored = self._stored
+        url_counts = self.url_counts
+        for url_hash, count in zip(hashes, visit_counts.tolist()):
+            before = url_counts.get(url_hash, 0)
+            previous = stored.get(url_hash, 0)
+            # Só a parte do total deste envio que ultrapassa a contagem anterior é nova
+            deltas.append(max(before + count - previous, 0) - max(before - previous, 0))
+            url_counts[url_hash] = before + count
+
+        dates = dates[dates <= self.today]
+        if not dates.empty:
+            self.watermark = max(self.watermark, dates.max())
+        return pd.Series(deltas, index=visit_counts.index, dtype='int64')
+
+    def _lookup(self, hashes: list[bytes]) -> dict[bytes, int]:
+        found = {}
+        for i in range(0, len(hashes), LOOKUP_CHUNK):
+            chunk = hashes[i:i + LOOKUP_CHUNK]
+            placeholders = ','.join('?' * len(chunk))
+            found.update(self._db.execute(
+                f"SELECT url_hash, visit_count FROM history_urls WHERE user_id = ? AND url_hash IN ({placeholders})",
+                (self.user_id, *chunk)
+            ).fetchall())
+        return found
+
+def _save(db: sqlite3.Connection, baseline: IncrementalBaseline, aggregator: history_service.HistoryAggregator) -> None:
+    """
+    Soma o agregado do envio ao banco, em uma única transação. Se outro envio do
+    mesmo usuário foi gravado desde a leitura do baseline, nada é gravado.
+    """
+    disc_scores = {
+        profile: baseline.disc_scores.get(profile, 0) + aggregator.disc_scores[profile]
+        for profile in aggregator.disc_scores
+    }
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        row = db.execute("SELECT version FROM history_users WHERE user_id = ?", (baseline.user_id,)).fetchone()
+        if (row[0] if row else 0) != baseline.version:
+            raise StoreConflictError("Outro envio deste usuário foi processado ao mesmo tempo. Tente novamente.")
+
+        db.executemany(
+            "INSERT INTO history_daily VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (user_id, domain, date) DO UPDATE SET visit_count = visit_count + excluded.visit_count",
+            ((baseline.user_id, domain, date, count) for (domain, date), count in sorted(aggregator.counts.items()))
+        )
+        db.executemany(
+            "INSERT INTO history_urls VALUES (?, ?, ?) "
+            "ON CONFLICT (user_id, url_hash) DO UPDATE SET visit_count = excluded.visit_count",
+            # Em ordem de chave, as inserções percorrem o índice sequencialmente
+            ((baseline.user_id, url_hash, count) for url_hash, count in sorted(baseline.url_counts.items()))
+        )
+        db.execute(
+            "INSERT INTO history_users VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (user_id) DO UPDATE SET watermark = excluded.watermark, "
+            "disc_scores = excluded.disc_scores, version = excluded.version",
+            (baseline.user_id, baseline.watermark, json.dumps(disc_scores), baseline.version + 1)
+        )
+        db.execute("COMMIT")
+    except BaseException:
+        db.execute("ROLLBACK")
+        raise
+    baseline.disc_scores = disc_scores
+
+def analyze_history_file(path: str, user_key: str, max_bytes: int | None = None, check=None) -> dict:
+    """
+    Igual a history_service.analyze_history_file, mas processa apenas as linhas
+    novas desde o último envio do usuário e monta o resumo e os scores DISC a
+    partir de todo o histórico guardado no banco.
+    """
+    uid = user_id(user_key)
+    with _connect() as db:
+        baseline = IncrementalBaseline(db, uid)
+        aggregator = history_service.HistoryAggregator(baseline=baseline)
+        history = history_service.analyze_history_file(path, max_bytes, check, aggregator)
+        if history["total_bytes"]:
+            _save(db, baseline, aggregator)
+
+        counts = {
+            (domain, date): count
+            for domain, date, count in db.execute(
+                "SELECT domain, date, visit_count FROM history_daily WHERE user_id = ?", (uid,)
+            )
+        }
+
+    print(f"Envio incremental: {aggregator.rows_parsed} linhas novas, {aggregator.rows_skipped} já processadas.")
+    history.update({
+        "summary": history_service.format_summary(counts),
+        "disc_scores": disc_service.normalize_scores(baseline.disc_scores),
+        "counts": counts,
+        "rows_skipped": aggregator.rows_skipped,
+    })
+    return history
+
+def delete_user(user_key: str) -> bool:
+    """
+    Remove todos os dados guardados de um usuário. Retorna False se não havia dados.
+    """
+    uid = user_id(user_key)
+    with _connect() as db:
+        db.execute("BEGIN IMMEDIATE")
+        deleted = db.execute("DELETE FROM history_users WHERE user_id = ?", (uid,)).rowcount
+        db.execute("DELETE FROM history_daily WHERE user_id = ?", (uid,))
+        db.execute("DELETE FROM history_urls WHERE user_id = ?", (uid,))
+        db.execute("COMMIT")
+    return deleted > 0
@@ -0,0 +1,234 @@
+import asyncio
+import concurrent.futures
+import concurrent.futures.process
+import multiprocessing
+import os
+import tempfile
+import time
+
+from . import browser_service
+from . import budget_service
+from . import encoding_service
+from . import history_service
+from . import metrics_service
+from . import store_service
+
+# Processos dedicados ao resumo dos históricos (configurável via .env).
+# Com 0, o resumo roda em uma única thread do próprio servidor.
+HISTORY_WORKERS = int(os.environ.get("HISTORY_WORKERS", str(os.cpu_count() or 1)))
+# Resumos que podem aguardar um processo livre; acima disso a requisição é recusada
+HISTORY_MAX_QUEUE = int(os.environ.get("HISTORY_MAX_QUEUE", "32"))
+# Prazo de cada resumo, contado a partir do envio (inclui a espera na fila)
+HISTORY_TIMEOUT_SECONDS = float(os.environ.get("HISTORY_TIMEOUT_SECONDS", "300"))
+
+# Folga dada ao processo para perceber o prazo entre dois blocos antes de o
+# servidor desistir de esperar pela resposta
+TIMEOUT_GRACE_SECONDS = 5
+
+class WorkerPoolBusyError(Exception):
+    """Há resumos demais na fila; novas requisições devem ser recusadas."""
+
+class SummaryTimeoutError(Exception):
+    """O resumo não terminou dentro do prazo."""
+
+class SummaryCancelledError(Exception):
+    """O resumo foi cancelado porque a requisição foi abandonada."""
+
+_executor: concurrent.futures.Executor | None = None
+_in_flight = 0
+
+def _get_executor() -> concurrent.futures.Executor:
+    global _executor
+    if _executor is None:
+        if HISTORY_WORKERS > 0:
+            # "spawn" evita copiar para os processos o estado do servidor
+            # (event loop, threads, conexões) que um fork levaria junto
+            _executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=HISTORY_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        else:
+            _executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    return _executor
+
+def _discard_broken(executor: concurrent.futures.Executor) -> None:
+    """
+    Descarta o pool depois que um processo morreu (ex: falta de memória), para
+    que as próximas requisições usem processos novos.
+    """
+    global _executor
+    if _executor is executor:
+        _executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def shutdown() -> None:
+    """
+    Encerra os processos de trabalho, cancelando os resumos ainda na fila.
+    """
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+def _warm_up_worker() -> None:
+    # Importa no processo de trabalho a biblioteca usada nos resumos
+    import pandas
+
+async def warm_up() -> None:
+    """
+    Inicia os processos de trabalho e importa neles o pandas, para que o
+    primeiro resumo não pague esse custo.
+    """
+    executor = _get_executor()
+    # Com todos os processos ocupados ao mesmo tempo, o pool inicia um para cada tarefa
+    await asyncio.gather(*(
+        asyncio.wrap_future(executor.submit(_warm_up_worker)) for _ in range(max(HISTORY_WORKERS, 1))
+    ))
+
+def create_input_file() -> tempfile.NamedTemporaryFile:
+    """
+    Cria o arquivo temporário que leva o histórico até o processo de trabalho.
+    Passar o caminho evita serializar (pickle) conteúdos de vários MB entre processos.
+    """
+    return tempfile.NamedTemporaryFile(prefix="history-", suffix=".upload", delete=False)
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+# --- Execução (no processo de trabalho) ---
+
+def _summarize(path: str, overhead_tokens: int, max_bytes: int | None, deadline: float,
+               cancel_path: str, keep_counts: bool, user_key: str | None) -> dict:
+    def check():
+        if os.path.exists(cancel_path):
+            raise SummaryCancelledError("O resumo foi cancelado.")
+        if time.time() > deadline:
+            raise SummaryTimeoutError("O processamento do histórico excedeu o tempo limite.")
+
+    if browser_service.is_database(path):
+        # O banco do navegador traz o histórico completo, agregado em SQL;
+        # não passa pela análise incremental, feita sobre o CSV das extensões
+        history = browser_service.analyze_history_file(path, max_bytes, check)
+    elif user_key and store_service.enabled():
+        history = store_service.analyze_history_file(path, user_key, max_bytes, check)
+    else:
+        history = history_service.analyze_history_file(path, max_bytes, check)
+    if not keep_counts:
+        # Evita devolver ao servidor um agregado que não será usado
+        del history["counts"]
+    if not history["total_bytes"]:
+        return history
+
+    lines_count = len(history["summary"].strip().split('\n'))
+    print(f"Histórico resumido com {lines_count} linhas.")
+
+    with metrics_service.timed("budget_reduction"):
+        history["summary"], history["reductions"] = budget_service.fit_summary_to_budget(
+            history["summary"], overhead_tokens=overhead_tokens, measure=encoding_service.summary_tokens
+        )
+    metrics_service.SUMMARY_ROWS.observe(max(len(history["summary"].strip().split('\n')) - 1, 0))
+    if history["reductions"]:
+        print(f"Resumo reduzido para caber no orçamento de tokens: {', '.join(history['reductions'])}")
+    return history
+
+def _run_task(*args) -> tuple:
+    """
+    Executa _summarize e devolve (resultado, erro, início, métricas). As métricas
+    registradas no processo de trabalho voltam junto para serem somadas no servidor.
+    """
+    started = time.time()
+    if HISTORY_WORKERS <= 0:
+        # Na thread do servidor as métricas já são registradas diretamente
+        try:
+            return _summarize(*args), None, started, None
+        except Exception as e:
+            return None, e, started, None
+
+    metrics_service.reset()
+    try:
+        return _summarize(*args), None, started, metrics_service.export_state()
+    except Exception as e:
+        return None, e, started, metrics_service.export_state()
+
+# --- Interface assíncrona (no servidor) ---
+
+async def summarize_file(path: str, overhead_tokens: int, max_bytes: int | None = None,
+                         timeout: float = HISTORY_TIMEOUT_SECONDS, keep_counts: bool = False,
+                         user_key: str | None = None) -> dict:
+    """
+    Resume o arquivo de histórico em `path` em um processo de trabalho, sem
+    bloquear o event loop. O arquivo é removido ao final. Com `keep_counts`,
+    o resultado inclui também o agregado (domínio, data) -> visitas. Com
+    `user_key` e o banco incremental ativo, só as linhas novas são processadas
+    (veja store_service). Bancos do Chrome e do Firefox são lidos diretamente
+    (veja browser_service).
+
+    O processo verifica o prazo e o cancelamento entre os blocos lidos; se a
+    requisição for cancelada ou o prazo se esgotar, ele para no próximo bloco.
+    Lança WorkerPoolBusyError quando a fila está cheia e SummaryTimeoutError
+    quando o prazo se esgota.
+    """
+    global _in_flight
+
+    if _in_flight >= max(HISTORY_WORKERS, 1) + HISTORY_MAX_QUEUE:
+        _remove(path)
+        raise WorkerPoolBusyError("Muitos históricos em processamento. Tente novamente em instantes.")
+
+    cancel_path = path + ".cancel"
+    submitted = time.time()
+    _in_flight += 1
+    executor = _get_executor()
+    try:
+        future = executor.submit(
+            _run_task, path, overhead_tokens, max_bytes, submitted + timeout, cancel_path, keep_counts, user_key
+        )
+    except Exception as e:
+        _in_flight -= 1
+        _remove(path)
+        if isinstance(e, concurrent.futures.process.BrokenProcessPool):
+            _discard_broken(executor)
+        raise
+
+    def cleanup(_):
+        # Roda quando a tarefa termina de fato, mesmo que a requisição já tenha desistido
+        _remove(path)
+        _remove(cancel_path)
+    future.add_done_callback(cleanup)
+
+    try:
+        history, error, started, state = await asyncio.wait_for(
+            asyncio.wrap_future(future), timeout=timeout + TIMEOUT_GRACE_SECONDS
+        )
+    except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+        if not future.done():
+            # Sinaliza ao processo que pare no próximo bloco
+            open(cancel_path, 'wb').close()
+            if future.done():
+                _remove(cancel_path)
+        if isinstance(e, asyncio.TimeoutError):
+            raise SummaryTimeoutError("O processamento do histórico excedeu o tempo limite.")
+        raise
+    except concurrent.futures.process.BrokenProcessPool:
+        _discard_broken(executor)
+        raise
+    finally:
+        _in_flight -= 1
+
+    metrics_service.STAGE_SECONDS.observe(max(started - submitted, 0.0), stage="worker_queue_wait")
+    if state:
+        metrics_service.merge_state(state)
+    if error is not None:
+        raise error
+    return history
+
+async def summarize_text(content: str, overhead_tokens: int, timeout: float = HISTORY_TIMEOUT_SECONDS,
+                         keep_counts: bool = False, user_key: str | None = None) -> dict:
+    """
+    Igual a summarize_file, para um histórico já carregado em memória.
+    """
+    with create_input_file() as input_file:
+        input_file.write(content.encode('utf-8'))
+    return await summarize_file(input_file.name, overhead_tokens, timeout=timeout,
+                                keep_counts=keep_counts, user_key=user_key)
@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pytest
+
+# Os testes importam os serviços como o servidor: `from services import ...`, a partir de backend/
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+# Gerador dos históricos sintéticos dos benchmarks, reaproveitado nos testes
+sys.path.insert(0, os.path.join(os.path.dirname(BACKEND_DIR), 'benchmarks'))
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    """
+    Substitui o cliente do Gemini pelo modelo falso, sem cache e sem espera entre tentativas.
+    """
+    from fake_gemini import FakeGeminiModel
+    from services import cache_service
+    from services import gemini_service
+
+    model = FakeGeminiModel()
+    monkeypatch.setattr(gemini_service, "model", model)
+    monkeypatch.setattr(gemini_service, "analysis_cache", cache_service.AnalysisCache(max_entries=0, db_path=""))
+    monkeypatch.setattr(gemini_service, "GEMINI_RETRY_BASE_SECONDS", 0.0)
+    # O semáforo é criado no primeiro uso, dentro do event loop de cada teste
+    monkeypatch.setattr(gemini_service, "_semaphore", None)
+    monkeypatch.setattr(gemini_service, "_waiting", 0)
+    return model
@@ -0,0 +1,63 @@
+"""
+Modelo Gemini falso para os testes, sem rede.
+
+Imita a interface de `GenerativeModel` usada por gemini_service
+(`generate_content`, `generate_content_async` e o modo `stream=True`).
+Cada chamada consome a próxima entrada de `responses`:
+
+- uma exceção é lançada (ex: FakeApiError(429));
+- um número é o atraso, em segundos, antes de responder com o relatório;
+- um texto é a resposta.
+
+Com `responses` vazia, as chamadas respondem com o relatório, após `delay` segundos.
+"""
+import asyncio
+
+FAKE_REPORT = "# Relatório de teste\n\nAnálise gerada pelo modelo falso.\n"
+
+class FakeApiError(Exception):
+    """Erro da API com o código HTTP no atributo `code`, como os de google.api_core."""
+
+    def __init__(self, code: int):
+        super().__init__(f"{code} erro da API")
+        self.code = code
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+class FakeStream:
+    def __init__(self, text: str):
+        self._text = text
+
+    async def __aiter__(self):
+        for word in self._text.split(' '):
+            yield FakeResponse(word + ' ')
+
+class FakeGeminiModel:
+    def __init__(self, responses: list | None = None, delay: float = 0.0, report: str = FAKE_REPORT):
+        self.responses = list(responses or [])
+        self.delay = delay
+        self.report = report
+        self.prompts: list[str] = []
+
+    @property
+    def calls(self) -> int:
+        return len(self.prompts)
+
+    async def _respond(self, prompt: str) -> str:
+        self.prompts.append(prompt)
+        response = self.responses.pop(0) if self.responses else self.delay
+        if isinstance(response, Exception):
+            raise response
+        if isinstance(response, str):
+            return response
+        await asyncio.sleep(response)
+        return self.report
+
+    def generate_content(self, prompt: str):
+        return FakeResponse(asyncio.run(self._respond(prompt)))
+
+    async def generate_content_async(self, prompt: str, stream: bool = False):
+        text = await self._respond(prompt)
+        return FakeStream(text) if stream else FakeResponse(text)
@@ -0,0 +1,52 @@
+import gzip
+import json
+import tempfile
+
+import starlette.datastructures
+from fastapi.testclient import TestClient
+from fake_gemini import FAKE_REPORT
+
+from services import worker_service
+
+CSV = b"URL,Last Visited,Visit Count\nhttps://github.com/a,2024-05-01,3\nhttps://news.com/b,2024-05-02,1\n"
+
+def test_batch_upload_summarizes_every_file(fake_model, tmp_path, monkeypatch):
+    # Resumos em uma thread do servidor e uploads temporários em uma pasta vigiada
+    monkeypatch.setattr(worker_service, "HISTORY_WORKERS", 0)
+    monkeypatch.setattr(worker_service, "_executor", None)
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    import main
+
+    # Como no FastAPI fixado em requirements.txt, os arquivos do upload são
+    # fechados quando o endpoint retorna, antes da transmissão da resposta
+    uploads = []
+    upload_init = starlette.datastructures.UploadFile.__init__
+    def track_upload(self, *args, **kwargs):
+        upload_init(self, *args, **kwargs)
+        uploads.append(self)
+    monkeypatch.setattr(starlette.datastructures.UploadFile, "__init__", track_upload)
+
+    batch_events = main.batch_events
+    async def events_after_close(*args, **kwargs):
+        for upload in uploads:
+            await upload.close()
+        async for event in batch_events(*args, **kwargs):
+            yield event
+    monkeypatch.setattr(main, "batch_events", events_after_close)
+
+    with TestClient(main.app) as client:
+        response = client.post("/analyze/batch/upload", files=[
+            ("files", ("a.csv", CSV, "text/csv")),
+            ("files", ("b.csv.gz", gzip.compress(CSV), "application/gzip")),
+        ])
+    worker_service.shutdown()
+
+    assert response.status_code == 200
+    events = [json.loads(line) for line in response.text.splitlines()]
+    members = sorted((event for event in events if event["type"] == "member"), key=lambda event: event["index"])
+    assert [(event["filename"], event["status"]) for event in members] == [("a.csv", "done"), ("b.csv.gz", "done")]
+    assert all(event["analysis"] == FAKE_REPORT for event in members)
+    assert events[-1]["type"] == "cohort"
+    assert events[-1]["status"] == "done"
+    assert events[-1]["members"] == 2
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,156 @@
+import asyncio
+import gzip
+import sqlite3
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+from generate_history import generate_history_csv
+
+from services import browser_service
+from services import history_service
+from services import worker_service
+
+# Segundos entre 1601-01-01 (época do Chrome) e 1970-01-01 (época do Firefox)
+CHROME_EPOCH_OFFSET = 11644473600
+
+def utc(text: str) -> datetime:
+    return datetime.fromisoformat(text).replace(tzinfo=timezone.utc)
+
+def write_database(path, schema: str, urls_sql: str, visits_sql: str, urls: list[str], visits: list[tuple]) -> str:
+    db = sqlite3.connect(path)
+    db.executescript(schema)
+    db.executemany(urls_sql, enumerate(urls))
+    db.executemany(visits_sql, visits)
+    db.commit()
+    db.close()
+    return str(path)
+
+def write_chrome_database(path, urls: list[str], visits: list[tuple[int, datetime, int]]) -> str:
+    """
+    Banco no formato do Chrome: `visits` é uma lista de (índice da URL, momento, transição).
+    """
+    return write_database(
+        path,
+        "CREATE TABLE urls (id INTEGER PRIMARY KEY, url LONGVARCHAR);"
+        "CREATE TABLE visits (id INTEGER PRIMARY KEY, url INTEGER, visit_time INTEGER, transition INTEGER);",
+        "INSERT INTO urls VALUES (?, ?)",
+        "INSERT INTO visits (url, visit_time, transition) VALUES (?, ?, ?)",
+        urls,
+        [(url_id, (int(moment.timestamp()) + CHROME_EPOCH_OFFSET) * 1_000_000, transition)
+         for url_id, moment, transition in visits],
+    )
+
+def write_firefox_database(path, urls: list[str], visits: list[tuple[int, datetime, int]]) -> str:
+    """
+    Banco no formato do Firefox: `visits` é uma lista de (índice da URL, momento, tipo da visita).
+    """
+    return write_database(
+        path,
+        "CREATE TABLE moz_places (id INTEGER PRIMARY KEY, url LONGVARCHAR);"
+        "CREATE TABLE moz_historyvisits (id INTEGER PRIMARY KEY, place_id INTEGER, visit_date INTEGER, visit_type INTEGER);",
+        "INSERT INTO moz_places VALUES (?, ?)",
+        "INSERT INTO moz_historyvisits (place_id, visit_date, visit_type) VALUES (?, ?, ?)",
+        urls,
+        [(url_id, int(moment.timestamp()) * 1_000_000, visit_type) for url_id, moment, visit_type in visits],
+    )
+
+URLS = ["https://github.com/a", "https://ads.example.com/frame", "file:///home/ana/notas.txt"]
+
+def test_chrome_database(tmp_path):
+    path = write_chrome_database(tmp_path / "History", URLS, [
+        # Os dias são os de UTC, na época de 1601 do Chrome
+        (0, utc("2024-05-01 00:00:01"), 1),
+        (0, utc("2024-05-01 23:59:59"), 0),
+        (0, utc("2024-05-02 00:00:00"), 1),
+        (2, utc("2024-05-02 10:00:00"), 1),
+        # Subframes (transições 3 e 4, inclusive com qualificadores) não aparecem no histórico
+        (1, utc("2024-05-01 10:00:00"), 3),
+        (1, utc("2024-05-01 10:00:00"), 4 | 0x30000000),
+    ])
+    history = browser_service.analyze_history_file(path)
+    assert history["source"] == "chrome"
+    assert history["encoding"] == "identity"
+    assert history["counts"] == {
+        ("github.com", "2024-05-01"): 2, ("github.com", "2024-05-02"): 1, ("local_files", "2024-05-02"): 1,
+    }
+    assert history["rows_parsed"] == 4
+
+def test_firefox_database(tmp_path):
+    path = write_firefox_database(tmp_path / "places.sqlite", URLS, [
+        # Os dias são os de UTC, na época de 1970 do Firefox
+        (0, utc("1970-01-01 00:00:00"), 1),
+        (0, utc("2024-05-01 23:59:59"), 2),
+        (2, utc("2024-05-02 00:00:00"), 1),
+        # Conteúdo embutido (tipo 4) e frames (tipo 8) não aparecem no histórico
+        (1, utc("2024-05-01 10:00:00"), 4),
+        (1, utc("2024-05-01 10:00:00"), 8),
+    ])
+    history = browser_service.analyze_history_file(path)
+    assert history["source"] == "firefox"
+    assert history["counts"] == {
+        ("github.com", "1970-01-01"): 1, ("github.com", "2024-05-01"): 1, ("local_files", "2024-05-02"): 1,
+    }
+
+def test_gzip_compressed_database(tmp_path):
+    path = write_chrome_database(tmp_path / "History", URLS, [(0, utc("2024-05-01 10:00:00"), 1)])
+    compressed = tmp_path / "History.gz"
+    compressed.write_bytes(gzip.compress(open(path, 'rb').read()))
+
+    assert browser_service.is_database(str(compressed))
+    history = browser_service.analyze_history_file(str(compressed))
+    assert history["encoding"] == "gzip"
+    assert history["counts"] == {("github.com", "2024-05-01"): 1}
+    # O banco descompactado é temporário
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["History", "History.gz"]
+
+def test_csv_is_not_a_database(tmp_path):
+    path = tmp_path / "history.csv"
+    path.write_text("URL,Last Visited,Visit Count\n")
+    assert not browser_service.is_database(str(path))
+
+def test_other_databases_are_unsupported(tmp_path):
+    db = sqlite3.connect(tmp_path / "other.sqlite")
+    db.execute("CREATE TABLE notes (id INTEGER PRIMARY KEY, text TEXT)")
+    db.commit()
+    db.close()
+    with pytest.raises(browser_service.UnsupportedDatabaseError):
+        browser_service.analyze_history_file(str(tmp_path / "other.sqlite"))
+
+    import main
+
+    async def summary():
+        return browser_service.analyze_history_file(str(tmp_path / "other.sqlite"))
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(main.run_summary(summary()))
+    assert error.value.status_code == 415
+
+def test_progress_handler_interrupts_the_query(tmp_path, monkeypatch):
+    monkeypatch.setattr(browser_service, "PROGRESS_STEPS", 10)
+    path = write_chrome_database(tmp_path / "History", URLS, [(0, utc("2024-05-01 10:00:00"), 1)] * 100)
+
+    def check():
+        raise worker_service.SummaryTimeoutError("O processamento do histórico excedeu o tempo limite.")
+
+    # O erro de `check` atravessa o SQLite, em vez de virar um banco inválido
+    with pytest.raises(worker_service.SummaryTimeoutError):
+        browser_service.analyze_history_file(path, check=check)
+
+def test_chrome_database_matches_the_csv_summary(tmp_path):
+    content = generate_history_csv(3000, seed=7)
+    urls, visits = [], []
+    for line in content.splitlines()[1:]:
+        parts = line.rsplit(',', 2)
+        if len(parts) != 3 or not parts[2].strip().isdigit():
+            continue
+        try:
+            day = datetime.strptime(parts[1].strip()[:10], '%Y-%m-%d')
+        except ValueError:
+            continue
+        # Uma visita comum (transição 1, TYPED) por contagem, ao meio-dia da data do CSV
+        visits.extend([(len(urls), day.replace(hour=12, tzinfo=timezone.utc), 1)] * int(parts[2]))
+        urls.append(parts[0])
+
+    history = browser_service.analyze_history_file(write_chrome_database(tmp_path / "History", urls, visits))
+    assert history["summary"] == history_service.summarize_history_data(content)
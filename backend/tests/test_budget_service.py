@@ -0,0 +1,91 @@
+import io
+from datetime import date, timedelta
+
+import pandas as pd
+import pytest
+
+from services import budget_service
+
+def make_summary(days: int, domains: int, end: date = date(2024, 5, 31)) -> str:
+    """
+    Resumo com `domains` domínios por dia; o domínio i tem i + 1 visitas.
+    """
+    lines = ["URL,Date,Visit Count"]
+    for offset in range(days):
+        day = (end - timedelta(days=offset)).isoformat()
+        lines.extend(f"https://site{i:03d}.example.com,{day},{i + 1}" for i in reversed(range(domains)))
+    return "\n".join(lines) + "\n"
+
+def read(summary: str) -> pd.DataFrame:
+    return pd.read_csv(io.StringIO(summary), dtype={'URL': str, 'Date': str})
+
+def test_summary_that_fits_is_unchanged():
+    summary = make_summary(3, 5)
+    assert budget_service.fit_summary_to_budget(summary, max_tokens=10_000) == (summary, [])
+
+def test_error_message_is_not_reduced():
+    message = "Erro ao processar dados do histórico."
+    assert budget_service.fit_summary_to_budget(message, max_tokens=1) == (message, [])
+
+def test_top_k_keeps_the_most_visited_and_sums_the_rest_in_other():
+    summary = make_summary(10, 100)
+    budget = budget_service.estimate_tokens(summary) // 2
+    reduced, reductions = budget_service.fit_summary_to_budget(summary, max_tokens=budget)
+
+    assert len(reductions) == 1 and reductions[0].startswith("top_")
+    k = int(reductions[0].split("_")[1])
+    df = read(reduced)
+    assert budget_service.estimate_tokens(reduced) <= budget
+    # Nenhuma visita se perde: o restante de cada dia vai para `other`
+    assert df['Visit Count'].sum() == read(summary)['Visit Count'].sum()
+    for _, day in df.groupby('Date'):
+        kept = day[day['URL'] != budget_service.OTHER_BUCKET]
+        assert len(kept) == k
+        assert kept['Visit Count'].min() == 100 - k + 1
+        assert day.loc[day['URL'] == budget_service.OTHER_BUCKET, 'Visit Count'].item() == sum(range(1, 100 - k + 1))
+
+def test_top_k_does_not_overshoot_the_budget():
+    # Com o K fixo (20), este resumo ficaria com menos de um terço do orçamento
+    summary = make_summary(60, 100)
+    budget = budget_service.estimate_tokens(summary) * 3 // 4
+    reduced, reductions = budget_service.fit_summary_to_budget(summary, max_tokens=budget)
+    assert int(reductions[0].split("_")[1]) > 20
+    assert 0.9 * budget <= budget_service.estimate_tokens(reduced) <= budget
+
+def test_stages_are_applied_in_order():
+    summary = make_summary(200, 30)
+    budget = budget_service.estimate_tokens(summary) // 20
+    reduced, reductions = budget_service.fit_summary_to_budget(summary, max_tokens=budget)
+
+    assert reductions[:-1] == [
+        "top_20_domains_per_period",
+        "top_10_domains_per_period",
+        f"weekly_rollup_older_than_{budget_service.BUDGET_RECENT_DAYS}_days",
+        f"monthly_rollup_older_than_{budget_service.BUDGET_MONTHLY_AFTER_DAYS}_days",
+    ]
+    # A etapa top_5 fez o resumo caber; K foi ajustado entre 5 e o K anterior (10)
+    assert 5 <= int(reductions[-1].split("_")[1]) < 10
+    assert budget_service.estimate_tokens(reduced) <= budget
+    dates = set(read(reduced)['Date'])
+    # Os dias recentes continuam diários; os mais antigos viram semanas e meses
+    assert "2024-05-31" in dates
+    assert any("-W" in value for value in dates)
+    assert "2023-12" in dates
+
+def test_truncation_is_the_last_resort():
+    summary = make_summary(200, 30)
+    reduced, reductions = budget_service.fit_summary_to_budget(summary, max_tokens=100)
+    assert reductions[-1].startswith("truncated_to_")
+    rows = int(reductions[-1].split("_")[2])
+    assert len(reduced.splitlines()) == rows + 1
+    assert budget_service.estimate_tokens(reduced) <= 100
+    # As primeiras linhas mantidas são as do dia mais recente
+    assert reduced.splitlines()[1].split(",")[1] == "2024-05-31"
+
+@pytest.mark.parametrize("overhead", [0, 50])
+def test_overhead_is_subtracted_from_the_budget(overhead):
+    summary = make_summary(5, 50)
+    budget = budget_service.estimate_tokens(summary)
+    reduced, reductions = budget_service.fit_summary_to_budget(summary, overhead_tokens=overhead, max_tokens=budget)
+    assert bool(reductions) == bool(overhead)
+    assert budget_service.estimate_tokens(reduced) <= budget - overhead
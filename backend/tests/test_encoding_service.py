@@ -0,0 +1,61 @@
+import pytest
+from generate_history import generate_history_csv
+
+from services import encoding_service
+from services import history_service
+
+def round_trip(summary_csv: str) -> str:
+    return encoding_service.decode_compact(encoding_service.encode_compact(summary_csv))
+
+def test_round_trip_of_a_summary():
+    summary = history_service.format_summary({
+        ("github.com", "2024-05-01"): 12,
+        ("www.youtube.com", "2024-05-01"): 34,
+        ("github.com", "2024-05-02"): 3,
+        ("local_files", "2024-05-02"): 7,
+    })
+    encoded = encoding_service.encode_compact(summary)
+    assert encoded.startswith(encoding_service.DOMAINS_SECTION)
+    assert "local_files" in encoded
+    assert encoding_service.decode_compact(encoded) == summary
+
+def test_most_visited_domains_get_the_shortest_ids():
+    summary = "URL,Date,Visit Count\nhttps://a.com,2024-05-01,1\nhttps://b.com,2024-05-01,9\n"
+    assert encoding_service.encode_compact(summary) == (
+        "[domains]\n0 https://b.com\n1 https://a.com\n[visits]\n2024-05-01 1:1 0:9\n"
+    )
+
+@pytest.mark.parametrize("domain", [
+    'https://a "quoted" name',
+    "https://a,b.com",
+    "https://with space.com",
+    'https://all "of, them" here',
+])
+def test_round_trip_of_domains_that_need_quoting(domain):
+    summary = history_service.format_summary({(domain.removeprefix("https://"), "2024-05-01"): 2,
+                                              ("github.com", "2024-05-01"): 1})
+    assert round_trip(summary) == summary
+
+@pytest.mark.parametrize("dates", [["2024-W05", "2024-W04"], ["2024-05", "2024-04"]])
+def test_round_trip_of_rolled_up_dates(dates):
+    summary = history_service.format_summary({
+        ("github.com", dates[0]): 5, ("github.com", dates[1]): 2, ("news.com", dates[1]): 8,
+    })
+    assert round_trip(summary) == summary
+
+def test_empty_summary_is_kept():
+    assert encoding_service.encode_compact("") == ""
+    assert encoding_service.decode_compact("") == ""
+
+def test_error_message_passes_through():
+    message = "Erro ao processar o arquivo CSV: formato inesperado."
+    assert encoding_service.encode_compact(message) == message
+    assert encoding_service.decode_compact(message) == message
+
+def test_missing_visits_section_is_rejected():
+    with pytest.raises(encoding_service.InvalidEncodingError):
+        encoding_service.decode_compact("[domains]\n0 https://a.com\n")
+
+def test_round_trip_of_a_synthetic_history():
+    summary = history_service.summarize_history_data(generate_history_csv(5000, seed=7))
+    assert round_trip(summary) == summary
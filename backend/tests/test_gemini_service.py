@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+from fake_gemini import FAKE_REPORT, FakeApiError
+
+from services import gemini_service
+
+SUMMARY = "URL,Date,Visit Count\nhttps://github.com,2024-05-01,3\n"
+
+def analyze(summary: str = SUMMARY) -> str:
+    return asyncio.run(gemini_service.generate_analysis_async(summary))
+
+def test_rate_limit_is_retried(fake_model):
+    fake_model.responses = [FakeApiError(429), FakeApiError(503)]
+    assert analyze() == FAKE_REPORT
+    assert fake_model.calls == 3
+
+def test_persistent_rate_limit(fake_model):
+    fake_model.responses = [FakeApiError(429)] * (gemini_service.GEMINI_MAX_RETRIES + 1)
+    with pytest.raises(gemini_service.GeminiRateLimitError):
+        analyze()
+    assert fake_model.calls == gemini_service.GEMINI_MAX_RETRIES + 1
+
+def test_client_errors_are_not_retried(fake_model):
+    fake_model.responses = [FakeApiError(400)]
+    assert analyze().startswith("Ocorreu um erro ao gerar a análise: 400")
+    assert fake_model.calls == 1
+
+def test_each_attempt_has_a_timeout(fake_model, monkeypatch):
+    monkeypatch.setattr(gemini_service, "GEMINI_TIMEOUT_SECONDS", 0.05)
+    fake_model.responses = [10.0]
+    assert analyze() == FAKE_REPORT
+    assert fake_model.calls == 2
+
+def test_persistent_timeout(fake_model, monkeypatch):
+    monkeypatch.setattr(gemini_service, "GEMINI_TIMEOUT_SECONDS", 0.05)
+    monkeypatch.setattr(gemini_service, "GEMINI_MAX_RETRIES", 1)
+    fake_model.delay = 10.0
+    assert "Sem resposta do Gemini" in analyze()
+    assert fake_model.calls == 2
+
+def test_full_queue_is_overloaded(fake_model, monkeypatch):
+    monkeypatch.setattr(gemini_service, "GEMINI_MAX_CONCURRENCY", 1)
+    monkeypatch.setattr(gemini_service, "GEMINI_MAX_QUEUE", 1)
+    fake_model.delay = 0.1
+
+    async def analyze_three():
+        # A primeira chamada ocupa a vaga, a segunda espera na fila e a terceira é recusada
+        calls = [gemini_service.generate_analysis_async(f"{SUMMARY}https://x{i}.com,2024-05-01,1\n") for i in range(3)]
+        return await asyncio.gather(*calls, return_exceptions=True)
+
+    first, second, third = asyncio.run(analyze_three())
+    assert first == second == FAKE_REPORT
+    assert isinstance(third, gemini_service.GeminiOverloadedError)
+    assert fake_model.calls == 2
+
+def test_stream_is_retried_before_the_first_chunk(fake_model):
+    fake_model.responses = [FakeApiError(503)]
+
+    async def stream():
+        return ''.join([text async for text in gemini_service.stream_analysis(SUMMARY)])
+
+    assert asyncio.run(stream()).strip() == FAKE_REPORT.strip()
+    assert fake_model.calls == 2
+
+@pytest.mark.parametrize("encoding, terms, absent", [
+    ("csv", ["`URL`", "coluna `Date`"], ["[domains]"]),
+    ("compact", ["`[domains]`", "`[visits]`"], ["`URL`", "coluna `Date`"]),
+])
+def test_reduction_note_follows_the_encoding(encoding, terms, absent):
+    prompt = gemini_service.get_analysis_prompt(SUMMARY, reductions=["top_20_domains_per_period"], encoding=encoding)
+    note = prompt[prompt.index("**Reduções aplicadas:**"):].split("\n")[0]
+    assert all(term in note for term in terms)
+    assert not any(term in note for term in absent)
@@ -0,0 +1,58 @@
+import pytest
+from generate_history import generate_history_csv
+
+from services import budget_service
+from services import history_service
+
+HEADER = "URL,Last Visited,Visit Count\n"
+
+def summary_dates(rows: list[str]) -> set[str]:
+    summary = history_service.summarize_history_data(HEADER + "\n".join(rows) + "\n")
+    return {line.split(',')[1] for line in summary.splitlines()[1:]}
+
+def test_iso_dates_use_the_utc_day():
+    assert summary_dates(["https://a.com/x,2024-05-01T23:59:00.000Z,1"]) == {"2024-05-01"}
+
+def test_ambiguous_slash_dates_are_month_first():
+    # Todos os dias até 12: a ordem padrão do pandas (mês primeiro) vale para o arquivo todo
+    rows = [f"https://a.com/{i},05/0{i % 9 + 1}/2024 10:00:00,1" for i in range(150)]
+    rows.append("https://b.com/x,05/20/2024,1")
+    assert summary_dates(rows) == {f"2024-05-0{day}" for day in range(1, 10)} | {"2024-05-20"}
+
+def test_day_first_is_detected_beyond_the_first_rows():
+    rows = [f"https://a.com/{i},0{i % 9 + 1}/05/2024 10:00:00,1" for i in range(150)]
+    rows += [f"https://b.com/{i},2{i % 8}/05/2024 10:00:00,1" for i in range(50)]
+    assert summary_dates(rows) == {f"2024-05-0{day}" for day in range(1, 10)} | {f"2024-05-2{day}" for day in range(8)}
+
+def test_unambiguous_day_first_rows():
+    rows = ["https://a.com/x,20/05/2024 10:00:00,1", "https://a.com/y,03/05/2024 10:00:00,1"]
+    assert summary_dates(rows) == {"2024-05-20", "2024-05-03"}
+
+def test_fallback_keeps_the_detected_order():
+    # Linhas fora do formato detectado (sem horário) seguem a mesma ordem de dia e mês
+    rows = [f"https://a.com/{i},2{i % 8}/05/2024 10:00:00,1" for i in range(150)]
+    rows.append("https://b.com/x,03/05/2024,1")
+    assert summary_dates(rows) == {f"2024-05-2{day}" for day in range(8)} | {"2024-05-03"}
+
+def test_impossible_iso_days_are_dropped():
+    rows = [f"https://a.com/{i},2024-05-0{i % 9 + 1}T10:00:00Z,1" for i in range(3000)]
+    rows += ["https://b.com/x,2024-02-30T10:00:00Z,1", "https://b.com/y,2024-13-45T10:00:00Z,1"]
+    summary = history_service.summarize_history_data(HEADER + "\n".join(rows) + "\n")
+    assert "2024-02-30" not in summary and "2024-13-45" not in summary
+    # Com as datas válidas, a redução pelo orçamento não falha
+    reduced, reductions = budget_service.fit_summary_to_budget(summary, max_tokens=20)
+    assert reductions
+
+def test_non_iso_rows_in_later_batches_use_the_fallback():
+    aggregator = history_service.HistoryAggregator(batch_rows=100)
+    rows = [f"https://a.com/{i},2024-05-01T10:00:00Z,1" for i in range(100)]
+    rows += ["https://b.com/x,05/20/2024 10:00:00,2", "https://c.com/x,not a date,1"]
+    aggregator.feed(HEADER + "\n".join(rows) + "\n")
+    assert aggregator.finish() == {("a.com", "2024-05-01"): 100, ("b.com", "2024-05-20"): 2}
+    assert aggregator.rows_dropped == 1
+
+@pytest.mark.parametrize("date_format", ["us", "br"])
+def test_slash_dates_match_the_iso_summary(date_format):
+    # Mesmas visitas do histórico sintético, com as datas em outro formato
+    expected = history_service.summarize_history_data(generate_history_csv(5000, seed=7))
+    assert history_service.summarize_history_data(generate_history_csv(5000, seed=7, date_format=date_format)) == expected
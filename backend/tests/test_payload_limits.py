@@ -0,0 +1,10 @@
+from fastapi.testclient import TestClient
+
+import main
+
+def test_large_json_content_points_to_the_upload_endpoints(monkeypatch):
+    monkeypatch.setattr(main, "MAX_JSON_CONTENT_KB", 1)
+    client = TestClient(main.app)
+    response = client.post("/analyze", json={"content": "x" * 2048, "filename": "history.csv"})
+    assert response.status_code == 413
+    assert "/analyze/upload" in response.json()["detail"]
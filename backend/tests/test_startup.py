@@ -0,0 +1,26 @@
+import json
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Tempo máximo de `import main` em um processo novo e bibliotecas que não podem
+# ser importadas na subida (são carregadas sob demanda ou pelo STARTUP_WARMUP)
+IMPORT_TIME_LIMIT_SECONDS = 1.0
+LAZY_MODULES = ['pandas', 'google.generativeai']
+
+def test_import_main_is_fast_and_lazy():
+    # Interpretador novo, como na subida de um worker do servidor
+    script = (
+        "import json, sys, time\n"
+        "start = time.perf_counter()\n"
+        "import main\n"
+        "elapsed = time.perf_counter() - start\n"
+        f"print(json.dumps([elapsed, [m for m in {LAZY_MODULES!r} if m in sys.modules]]))\n"
+    )
+    completed = subprocess.run([sys.executable, '-c', script], cwd=BACKEND_DIR,
+                               capture_output=True, text=True, check=True)
+    elapsed, loaded = json.loads(completed.stdout.strip().splitlines()[-1])
+    assert loaded == [], f"`import main` carregou {', '.join(loaded)}; esses módulos devem ser importados sob demanda."
+    assert elapsed < IMPORT_TIME_LIMIT_SECONDS, f"`import main` levou {elapsed:.2f}s (limite: {IMPORT_TIME_LIMIT_SECONDS:.1f}s)."
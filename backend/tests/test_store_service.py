@@ -0,0 +1,115 @@
+import asyncio
+import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from services import history_service
+from services import store_service
+
+USER_KEY = "k" * store_service.USER_KEY_MIN_LENGTH
+HEADER = "URL,Last Visited,Visit Count\n"
+
+@pytest.fixture(autouse=True)
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(store_service, "HISTORY_STORE_DB", str(tmp_path / "store.db"))
+    monkeypatch.setattr(store_service, "HISTORY_STORE_SECRET", "segredo")
+
+def upload(tmp_path, rows: list[str], user_key: str = USER_KEY) -> dict:
+    path = tmp_path / "history.csv"
+    path.write_text(HEADER + "\n".join(rows) + "\n")
+    return store_service.analyze_history_file(str(path), user_key)
+
+FIRST = [
+    "https://a.com/1,2024-05-01T10:00:00Z,3",
+    "https://b.com/1,2024-05-02T10:00:00Z,2",
+]
+
+def test_first_upload_counts_every_row(tmp_path):
+    history = upload(tmp_path, FIRST)
+    assert history["counts"] == {("a.com", "2024-05-01"): 3, ("b.com", "2024-05-02"): 2}
+    assert history["rows_skipped"] == 0
+
+def test_identical_upload_is_idempotent(tmp_path):
+    upload(tmp_path, FIRST)
+    history = upload(tmp_path, FIRST)
+    assert history["counts"] == {("a.com", "2024-05-01"): 3, ("b.com", "2024-05-02"): 2}
+    assert history["rows_parsed"] == 0
+
+def test_cumulative_upload_adds_only_new_visits(tmp_path):
+    upload(tmp_path, FIRST)
+    # a.com/1 foi visitada de novo: o total passou de 3 para 5, com a última visita em junho
+    history = upload(tmp_path, ["https://a.com/1,2024-06-01T10:00:00Z,5", FIRST[1]])
+    assert history["counts"] == {
+        ("a.com", "2024-05-01"): 3, ("a.com", "2024-06-01"): 2, ("b.com", "2024-05-02"): 2,
+    }
+
+def test_non_iso_dates(tmp_path):
+    upload(tmp_path, ["https://a.com/1,05/01/2024 10:00:00,3"])
+    history = upload(tmp_path, ["https://a.com/1,05/01/2024 10:00:00,3", "https://a.com/2,06/01/2024 10:00:00,1"])
+    assert history["counts"] == {("a.com", "2024-05-01"): 3, ("a.com", "2024-06-01"): 1}
+
+@pytest.mark.parametrize("poisoned", ["2024-13-45T00:00:00Z", "2099-01-01T00:00:00Z", "9999-12-31T00:00:00Z"])
+def test_invalid_or_future_dates_do_not_move_the_watermark(tmp_path, poisoned):
+    upload(tmp_path, FIRST + [f"https://c.com/1,{poisoned},1"])
+    with store_service._connect() as db:
+        assert db.execute("SELECT watermark FROM history_users").fetchone()[0] == "2024-05-02"
+    history = upload(tmp_path, FIRST + ["https://d.com/1,2024-06-01T10:00:00Z,2"])
+    assert history["counts"][("d.com", "2024-06-01")] == 2
+    assert history["rows_parsed"] == 1
+
+def test_stored_future_watermark_is_ignored(tmp_path):
+    upload(tmp_path, FIRST)
+    with store_service._connect() as db:
+        db.execute("UPDATE history_users SET watermark = '9999-12-31'")
+    history = upload(tmp_path, FIRST + ["https://d.com/1,2024-06-01T10:00:00Z,2"])
+    assert history["counts"] == {
+        ("a.com", "2024-05-01"): 3, ("b.com", "2024-05-02"): 2, ("d.com", "2024-06-01"): 2,
+    }
+    with store_service._connect() as db:
+        assert db.execute("SELECT watermark FROM history_users").fetchone()[0] == "2024-06-01"
+
+def test_today_is_the_latest_watermark(tmp_path):
+    today = datetime.datetime.now(datetime.timezone.utc).date()
+    tomorrow = today + datetime.timedelta(days=1)
+    upload(tmp_path, [f"https://a.com/1,{today}T00:00:00Z,1", f"https://a.com/2,{tomorrow}T00:00:00Z,1"])
+    with store_service._connect() as db:
+        assert db.execute("SELECT watermark FROM history_users").fetchone()[0] == today.isoformat()
+
+def test_concurrent_upload_is_a_conflict(tmp_path, monkeypatch):
+    analyze = history_service.analyze_history_file
+    other = tmp_path / "other.csv"
+    other.write_text(HEADER + FIRST[0] + "\n")
+
+    def analyze_during_other_upload(*args, **kwargs):
+        # Outro envio do mesmo usuário é gravado enquanto este é processado
+        monkeypatch.setattr(history_service, "analyze_history_file", analyze)
+        store_service.analyze_history_file(str(other), USER_KEY)
+        return analyze(*args, **kwargs)
+
+    monkeypatch.setattr(history_service, "analyze_history_file", analyze_during_other_upload)
+    with pytest.raises(store_service.StoreConflictError):
+        upload(tmp_path, FIRST)
+
+    import main
+
+    async def conflict():
+        raise store_service.StoreConflictError("conflito")
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(main.run_summary(conflict()))
+    assert error.value.status_code == 409
+
+def test_delete_user(tmp_path):
+    upload(tmp_path, FIRST)
+    upload(tmp_path, ["https://z.com/1,2024-05-01T10:00:00Z,1"], user_key="o" * 40)
+    assert store_service.delete_user(USER_KEY)
+    assert not store_service.delete_user(USER_KEY)
+    # Depois de apagado, o envio seguinte é tratado como o primeiro
+    assert upload(tmp_path, FIRST[:1])["counts"] == {("a.com", "2024-05-01"): 3}
+    assert upload(tmp_path, [], user_key="o" * 40)["counts"] == {("z.com", "2024-05-01"): 1}
+
+@pytest.mark.parametrize("user_key", ["maria@example.com", "curta", "x" * 31])
+def test_weak_user_keys_are_rejected(tmp_path, user_key):
+    with pytest.raises(store_service.InvalidUserKeyError):
+        upload(tmp_path, FIRST, user_key=user_key)
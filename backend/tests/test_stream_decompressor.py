@@ -0,0 +1,39 @@
+import gzip
+import os
+
+import pytest
+
+from services import history_service
+
+def decompress(data: bytes, chunk_size: int = 7) -> bytes:
+    decompressor = history_service.StreamDecompressor()
+    output = b''
+    for i in range(0, len(data), chunk_size):
+        output += decompressor.decompress(data[i:i + chunk_size])
+    return output + decompressor.flush()
+
+def test_plain_csv_passes_through():
+    assert decompress(b"URL,Last Visited,Visit Count\n") == b"URL,Last Visited,Visit Count\n"
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1024 * 1024])
+def test_multi_member_gzip_is_read_to_the_end(chunk_size):
+    first, second = b"URL,Last Visited,Visit Count\n", b"https://a.com,2024-05-01,1\n"
+    assert decompress(gzip.compress(first) + gzip.compress(second), chunk_size) == first + second
+
+def test_truncated_gzip_is_rejected():
+    data = gzip.compress(os.urandom(4096))
+    with pytest.raises(history_service.CorruptedUploadError):
+        decompress(data[:len(data) // 2])
+
+zstandard = pytest.importorskip("zstandard")
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1024 * 1024])
+def test_multi_frame_zstd_is_read_to_the_end(chunk_size):
+    compressor = zstandard.ZstdCompressor()
+    first, second = b"URL,Last Visited,Visit Count\n", b"https://a.com,2024-05-01,1\n"
+    assert decompress(compressor.compress(first) + compressor.compress(second), chunk_size) == first + second
+
+def test_truncated_zstd_is_rejected():
+    data = zstandard.ZstdCompressor().compress(os.urandom(4096))
+    with pytest.raises(history_service.CorruptedUploadError):
+        decompress(data[:len(data) // 2])
@@ -0,0 +1,55 @@
+"""
+Modelo Gemini falso, sem rede, para medir a latência da API de ponta a ponta.
+
+Substitui `gemini_service.model` e imita a interface de `GenerativeModel`
+(`generate_content`, `generate_content_async` e o modo `stream=True`),
+respondendo após um atraso configurável.
+"""
+import asyncio
+import time
+
+FAKE_REPORT = "# Relatório de teste\n\nAnálise gerada pelo modelo falso dos benchmarks.\n"
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+class FakeStream:
+    def __init__(self, chunks: list[str], delay: float):
+        self._chunks = chunks
+        self._delay = delay
+
+    async def __aiter__(self):
+        for chunk in self._chunks:
+            await asyncio.sleep(self._delay)
+            yield FakeResponse(chunk)
+
+class FakeGeminiModel:
+    """
+    `latency` é o tempo total de cada resposta; no modo streaming ele é
+    dividido entre as partes do relatório.
+    """
+
+    def __init__(self, latency: float = 0.0, report: str = FAKE_REPORT):
+        self.latency = latency
+        self.report = report
+        self.calls = 0
+        self.prompt_chars = 0
+
+    def _record(self, prompt: str) -> None:
+        self.calls += 1
+        self.prompt_chars += len(prompt)
+
+    def generate_content(self, prompt: str):
+        self._record(prompt)
+        time.sleep(self.latency)
+        return FakeResponse(self.report)
+
+    async def generate_content_async(self, prompt: str, stream: bool = False):
+        self._record(prompt)
+        if stream:
+            chunks = self.report.split(' ')
+            chunks = [chunk + ' ' for chunk in chunks[:-1]] + chunks[-1:]
+            return FakeStream(chunks, self.latency / len(chunks))
+        await asyncio.sleep(self.latency)
+        return FakeResponse(self.report)
@@ -0,0 +1,128 @@
+"""
+Gera históricos de navegação sintéticos (CSV) para os benchmarks.
+
+O arquivo segue o formato das extensões de exportação (URL, Last Visited, Visit Count)
+e inclui os casos difíceis encontrados em exportações reais: domínios com
+distribuição de Zipf, vírgulas dentro das URLs, linhas malformadas e entradas `file://`.
+A mesma semente sempre gera o mesmo arquivo.
+
+Uso:
+    python benchmarks/generate_history.py --rows 100000 --seed 42 -o history_100k.csv
+    python benchmarks/generate_history.py --rows 100000 --date-format us -o history_us.csv
+"""
+import argparse
+import random
+import sys
+from datetime import datetime, timedelta, timezone
+
+# Domínios reais (alguns com palavras-chave DISC), seguidos de domínios sintéticos
+KNOWN_DOMAINS = [
+    'www.google.com', 'www.youtube.com', 'github.com', 'stackoverflow.com', 'x.com',
+    'www.instagram.com', 'www.linkedin.com', 'web.whatsapp.com', 'docs.python.org',
+    'pt.wikipedia.org', 'medium.com', 'www.reddit.com', 'www.netflix.com', 'www.bloomberg.com',
+    'br.pinterest.com', 'arxiv.org', 'pypi.org', 'www.tradingview.com', 'mail.google.com',
+    'scholar.google.com',
+]
+SYNTHETIC_DOMAINS = 5000
+ZIPF_EXPONENT = 1.1
+
+PATH_WORDS = [
+    'home', 'search', 'watch', 'data', 'learning', 'tutorial', 'social', 'events',
+    'news', 'article', 'profile', 'settings', 'cooking', 'stocks', 'research', 'docs',
+    'issues', 'pull', 'questions', 'feed', 'meditation', 'strategy', 'how-to', 'community',
+]
+
+# Proporção das linhas especiais
+MALFORMED_RATE = 0.002
+FILE_URL_RATE = 0.01
+COMMA_URL_RATE = 0.05
+
+HISTORY_DAYS = 365
+BATCH_ROWS = 10000
+
+# Formatos de `Last Visited`: ISO 8601 (padrão das extensões) ou datas com
+# barras, com o mês primeiro (exportações em inglês) ou o dia primeiro
+DATE_FORMATS = {
+    'iso': '%Y-%m-%dT%H:%M:%S.000Z',
+    'us': '%m/%d/%Y %H:%M:%S',
+    'br': '%d/%m/%Y %H:%M:%S',
+}
+
+def build_domains() -> tuple[list[str], list[float]]:
+    """
+    Retorna os domínios e os pesos cumulativos da distribuição de Zipf.
+    """
+    domains = KNOWN_DOMAINS + [f'site{i}.example.com' for i in range(SYNTHETIC_DOMAINS)]
+    cumulative = []
+    total = 0.0
+    for rank in range(1, len(domains) + 1):
+        total += 1 / rank ** ZIPF_EXPONENT
+        cumulative.append(total)
+    return domains, cumulative
+
+def generate_lines(rows: int, seed: int = 42, end: datetime | None = None, date_format: str = 'iso'):
+    """
+    Produz as linhas do CSV (com o cabeçalho), sem quebra de linha no final.
+    A mesma semente gera as mesmas visitas em qualquer `date_format`.
+    """
+    timestamp_format = DATE_FORMATS[date_format]
+    rng = random.Random(seed)
+    domains, cumulative = build_domains()
+    end = end or datetime(2025, 1, 1, tzinfo=timezone.utc)
+    span_seconds = HISTORY_DAYS * 24 * 3600
+
+    yield 'URL,Last Visited,Visit Count'
+    produced = 0
+    while produced < rows:
+        batch = min(BATCH_ROWS, rows - produced)
+        chosen = rng.choices(domains, cum_weights=cumulative, k=batch)
+        for domain in chosen:
+            roll = rng.random()
+            if roll < MALFORMED_RATE:
+                yield f'linha-corrompida-{rng.randrange(10 ** 6)}'
+                continue
+
+            if roll < MALFORMED_RATE + FILE_URL_RATE:
+                url = f'file:///home/user/{rng.choice(PATH_WORDS)}/doc{rng.randrange(1000)}.html'
+            else:
+                path = '/'.join(rng.choice(PATH_WORDS) for _ in range(rng.randint(1, 3)))
+                url = f'https://{domain}/{path}/{rng.randrange(10 ** 5)}'
+                if rng.random() < COMMA_URL_RATE:
+                    url += f'?q={rng.choice(PATH_WORDS)},{rng.choice(PATH_WORDS)}&ids=1,2,3'
+
+            visited = end - timedelta(seconds=rng.randrange(span_seconds))
+            visit_count = min(int(rng.expovariate(0.25)) + 1, 500)
+            yield f"{url},{visited.strftime(timestamp_format)},{visit_count}"
+        produced += batch
+
+def generate_history_csv(rows: int, seed: int = 42, date_format: str = 'iso') -> str:
+    """
+    Retorna o histórico sintético inteiro como string (para tamanhos pequenos).
+    """
+    return '\n'.join(generate_lines(rows, seed, date_format=date_format)) + '\n'
+
+def write_history_csv(path: str, rows: int, seed: int = 42, date_format: str = 'iso') -> None:
+    """
+    Grava o histórico sintético em `path`, linha a linha, sem montá-lo em memória.
+    """
+    with open(path, 'w', encoding='utf-8', newline='') as output:
+        for line in generate_lines(rows, seed, date_format=date_format):
+            output.write(line)
+            output.write('\n')
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera um histórico de navegação sintético em CSV.")
+    parser.add_argument('--rows', type=int, default=100000, help="Quantidade de linhas de dados.")
+    parser.add_argument('--seed', type=int, default=42, help="Semente do gerador.")
+    parser.add_argument('--date-format', choices=sorted(DATE_FORMATS), default='iso', help="Formato de 'Last Visited'.")
+    parser.add_argument('-o', '--output', default='-', help="Arquivo de saída ('-' para stdout).")
+    args = parser.parse_args()
+
+    if args.output == '-':
+        for line in generate_lines(args.rows, args.seed, date_format=args.date_format):
+            sys.stdout.write(line + '\n')
+    else:
+        write_history_csv(args.output, args.rows, args.seed, args.date_format)
+
+if __name__ == '__main__':
+    main()
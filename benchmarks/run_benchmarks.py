@@ -0,0 +1,339 @@
+"""
+Benchmarks do processamento de históricos e da API.
+
+Cada caso roda em um subprocesso separado, para que o pico de memória (RSS)
+medido seja só dele. Os históricos sintéticos são gerados uma vez por
+tamanho/semente e reaproveitados em `benchmarks/.data/`.
+
+Uso:
+    python benchmarks/run_benchmarks.py                       # 10k e 100k linhas
+    python benchmarks/run_benchmarks.py --scales 10k,100k,1m,10m
+    python benchmarks/run_benchmarks.py --cases summarize_history_data --repeat 5
+    python benchmarks/run_benchmarks.py --save-baseline       # grava baselines.json
+    python benchmarks/run_benchmarks.py --tolerance 0.2       # falha se cair mais de 20%
+
+Com um `baselines.json` presente, cada resultado é comparado com o valor
+guardado. O script termina com código 1 se houver regressão ou se algum caso
+falhar; a corretude dos resultados é verificada pelos testes (backend/tests).
+"""
+import argparse
+import contextlib
+import gzip
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(os.path.dirname(BENCH_DIR), 'backend')
+DATA_DIR = os.path.join(BENCH_DIR, '.data')
+BASELINE_PATH = os.path.join(BENCH_DIR, 'baselines.json')
+
+SCALES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000, '10m': 10_000_000}
+DEFAULT_SCALES = '10k,100k'
+CASES = [
+    'get_hostname',
+    'extract_hostnames',
+    'disc_scores',
+    'summarize_history_data',
+    'summarize_stream',
+    'summarize_us_dates',
+    'summarize_br_dates',
+    'compact_encoding',
+    'browser_database',
+    'analyze_endpoint',
+    'analyze_upload_endpoint',
+]
+
+# Limite padrão de /analyze (MAX_JSON_CONTENT_KB); acima disso o caso é ignorado
+ANALYZE_JSON_LIMIT = 2000 * 1024
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss é em KB no Linux e em bytes no macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def dataset_path(rows: int, seed: int, date_format: str = 'iso') -> str:
+    """
+    Retorna o caminho do histórico sintético, gerando-o na primeira vez.
+    """
+    sys.path.insert(0, BENCH_DIR)
+    from generate_history import write_history_csv
+
+    os.makedirs(DATA_DIR, exist_ok=True)
+    suffix = '' if date_format == 'iso' else f'_{date_format}'
+    path = os.path.join(DATA_DIR, f'history_{rows}_{seed}{suffix}.csv')
+    if not os.path.exists(path):
+        print(f"Gerando histórico sintético com {rows} linhas...", file=sys.stderr)
+        write_history_csv(path + '.tmp', rows, seed, date_format)
+        os.replace(path + '.tmp', path)
+    return path
+
+# --- Casos (executados no subprocesso) ---
+
+def _read_text(path: str) -> str:
+    with open(path, encoding='utf-8') as history_file:
+        return history_file.read()
+
+def _read_rows(path: str):
+    import pandas as pd
+
+    rows = [line.rsplit(',', 2) for line in _read_text(path).splitlines()[1:]]
+    rows = [parts for parts in rows if len(parts) == 3]
+    df = pd.DataFrame(rows, columns=['URL', 'Last Visited', 'Visit Count'])
+    df['Visit Count'] = pd.to_numeric(df['Visit Count'], errors='coerce').fillna(0).astype(int)
+    return df
+
+def _write_chrome_database(path: str) -> str:
+    """
+    Converte o CSV sintético em um banco no formato do Chrome (`urls`/`visits`),
+    com `Visit Count` visitas de cada URL na data de `Last Visited`.
+    """
+    import sqlite3
+    from datetime import datetime, timezone
+
+    database = path[:-len('.csv')] + '.chrome.sqlite'
+    if os.path.exists(database):
+        return database
+
+    # Microssegundos entre 1601-01-01 (época do Chrome) e 1970-01-01
+    chrome_epoch_us = 11644473600 * 1_000_000
+    db = sqlite3.connect(database + '.tmp')
+    db.executescript(
+        "DROP TABLE IF EXISTS urls; DROP TABLE IF EXISTS visits;"
+        "CREATE TABLE urls (id INTEGER PRIMARY KEY, url LONGVARCHAR);"
+        "CREATE TABLE visits (id INTEGER PRIMARY KEY, url INTEGER, visit_time INTEGER, transition INTEGER);"
+    )
+    df = _read_rows(path)
+    urls, visits = [], []
+    for url_id, (url, visited, count) in enumerate(df.itertuples(index=False)):
+        try:
+            day = datetime.strptime(visited.strip()[:10], '%Y-%m-%d').replace(hour=12, tzinfo=timezone.utc)
+        except ValueError:
+            continue
+        visit_time = int(day.timestamp()) * 1_000_000 + chrome_epoch_us
+        urls.append((url_id, url))
+        # Transição 1 (TYPED): uma visita comum, exibida no histórico
+        visits.extend([(url_id, visit_time, 1)] * count)
+    db.executemany("INSERT INTO urls VALUES (?, ?)", urls)
+    db.executemany("INSERT INTO visits (url, visit_time, transition) VALUES (?, ?, ?)", visits)
+    db.commit()
+    db.close()
+    os.replace(database + '.tmp', database)
+    return database
+
+def setup_case(case: str, path: str):
+    """
+    Prepara os dados de entrada e retorna a função medida.
+    """
+    from services import history_service
+
+    if case == 'get_hostname':
+        urls = _read_rows(path)['URL'].tolist()
+        return lambda: [history_service.get_hostname(url) for url in urls]
+
+    if case == 'extract_hostnames':
+        urls = _read_rows(path)['URL']
+        def run():
+            history_service._hostname_for_prefix.cache_clear()
+            return history_service.extract_hostnames(urls)
+        return run
+
+    if case == 'disc_scores':
+        from services import disc_service
+
+        df = _read_rows(path)
+        def run():
+            scores = disc_service.empty_scores()
+            disc_service.add_scores(scores, df['URL'], df['Visit Count'])
+            return disc_service.normalize_scores(scores)
+        return run
+
+    if case == 'summarize_history_data':
+        content = _read_text(path)
+        return lambda: history_service.summarize_history_data(content)
+
+    if case in ('summarize_us_dates', 'summarize_br_dates'):
+        # Mesmas visitas do histórico ISO, com datas no formato com barras
+        date_format = case.split('_')[1]
+        rows, seed = (int(part) for part in os.path.basename(path)[:-len('.csv')].split('_')[1:3])
+        content = _read_text(dataset_path(rows, seed, date_format))
+        return lambda: history_service.summarize_history_data(content)
+
+    if case == 'summarize_stream':
+        def run():
+            with open(path, 'rb') as history_file:
+                chunks = iter(lambda: history_file.read(history_service.CHUNK_SIZE), b'')
+                return history_service.summarize_history_stream(chunks)
+        return run
+
+    if case == 'compact_encoding':
+        from services import encoding_service
+
+        summary = history_service.summarize_history_data(_read_text(path))
+        return lambda: encoding_service.decode_compact(encoding_service.encode_compact(summary))
+
+    if case == 'browser_database':
+        from services import browser_service
+
+        database = _write_chrome_database(path)
+        return lambda: browser_service.analyze_history_file(database)
+
+    if case in ('analyze_endpoint', 'analyze_upload_endpoint'):
+        return setup_endpoint_case(case, path)
+
+    raise ValueError(f"Caso desconhecido: {case}")
+
+def setup_endpoint_case(case: str, path: str):
+    """
+    Mede uma requisição completa à API, com o Gemini substituído pelo modelo falso.
+    """
+    sys.path.insert(0, BENCH_DIR)
+    from fake_model import FakeGeminiModel
+    from fastapi.testclient import TestClient
+    from services import cache_service, gemini_service
+    import main
+
+    gemini_service.model = FakeGeminiModel(latency=float(os.environ.get('FAKE_MODEL_LATENCY', '0')))
+    # Sem cache, para que toda requisição passe pelo modelo
+    gemini_service.analysis_cache = cache_service.AnalysisCache(max_entries=0, db_path='')
+    client = TestClient(main.app)
+
+    if case == 'analyze_endpoint':
+        content = _read_text(path)
+        if len(content) > ANALYZE_JSON_LIMIT:
+            return None
+        payload = {'content': content, 'filename': os.path.basename(path)}
+        def run():
+            response = client.post('/analyze', json=payload)
+            response.raise_for_status()
+        return run
+
+    with open(path, 'rb') as history_file:
+        compressed = gzip.compress(history_file.read(), compresslevel=6)
+    def run():
+        files = {'file': ('history.csv.gz', compressed, 'application/gzip')}
+        response = client.post('/analyze/upload', files=files)
+        response.raise_for_status()
+    return run
+
+def run_worker(case: str, rows: int, seed: int, repeat: int) -> dict:
+    sys.path.insert(0, BACKEND_DIR)
+    path = dataset_path(rows, seed)
+
+    # Os avisos de linhas ignoradas são impressos pelo backend; não entram na medição
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        func = setup_case(case, path)
+        setup_rss = peak_rss_mb()
+        if func is None:
+            return {'case': case, 'rows': rows, 'skipped': True}
+
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+
+    best = min(timings)
+    return {
+        'case': case,
+        'rows': rows,
+        'seconds': best,
+        'rows_per_second': rows / best if best > 0 else float('inf'),
+        'setup_rss_mb': setup_rss,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+# --- Orquestração (processo principal) ---
+
+def run_case(case: str, rows: int, seed: int, repeat: int) -> dict:
+    command = [sys.executable, os.path.abspath(__file__), '--worker', case,
+               '--rows', str(rows), '--seed', str(seed), '--repeat', str(repeat)]
+    completed = subprocess.run(command, capture_output=True, text=True)
+    if completed.returncode != 0:
+        return {'case': case, 'rows': rows, 'error': completed.stderr.strip().splitlines()[-1:]}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def load_baselines() -> dict:
+    if not os.path.exists(BASELINE_PATH):
+        return {}
+    with open(BASELINE_PATH, encoding='utf-8') as baseline_file:
+        return json.load(baseline_file)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks do Analisador de Hábitos Digitais.")
+    parser.add_argument('--scales', default=DEFAULT_SCALES, help=f"Tamanhos separados por vírgula ({', '.join(SCALES)}).")
+    parser.add_argument('--cases', default=','.join(CASES), help="Casos separados por vírgula.")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeat', type=int, default=3, help="Repetições por caso; vale o melhor tempo.")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Queda de vazão aceita antes de acusar regressão.")
+    parser.add_argument('--save-baseline', action='store_true', help="Grava os resultados em baselines.json.")
+    parser.add_argument('--json', action='store_true', help="Imprime os resultados em JSON.")
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    parser.add_argument('--rows', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.worker, args.rows, args.seed, args.repeat)))
+        return
+
+    baselines = load_baselines()
+    results = []
+    regressions = []
+    failures = []
+    for scale in args.scales.split(','):
+        rows = SCALES[scale.strip().lower()]
+        for case in args.cases.split(','):
+            result = run_case(case.strip(), rows, args.seed, args.repeat)
+            key = f"{result['case']}@{rows}"
+            baseline = baselines.get(key)
+            if baseline and 'rows_per_second' in result:
+                result['baseline_rows_per_second'] = baseline
+                result['regression'] = result['rows_per_second'] < baseline * (1 - args.tolerance)
+                if result['regression']:
+                    regressions.append(key)
+            if 'error' in result:
+                failures.append(key)
+            results.append(result)
+
+            if not args.json:
+                print(format_result(result), flush=True)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+    if args.save_baseline:
+        for result in results:
+            if 'rows_per_second' in result:
+                baselines[f"{result['case']}@{result['rows']}"] = result['rows_per_second']
+        with open(BASELINE_PATH, 'w', encoding='utf-8') as baseline_file:
+            json.dump(baselines, baseline_file, indent=2, sort_keys=True)
+        print(f"Baselines gravadas em {BASELINE_PATH}")
+
+    if failures:
+        print(f"Casos com erro: {', '.join(failures)}")
+    if regressions:
+        print(f"Regressões acima de {args.tolerance:.0%}: {', '.join(regressions)}")
+    if failures or regressions:
+        sys.exit(1)
+
+def format_result(result: dict) -> str:
+    label = f"{result['case']:<26} {result['rows']:>10,} linhas"
+    if result.get('skipped'):
+        return f"{label}  ignorado (acima do limite do endpoint)"
+    if 'error' in result:
+        return f"{label}  ERRO: {' '.join(result['error'])}"
+
+    line = (f"{label}  {result['seconds']:8.3f}s  {result['rows_per_second']:>12,.0f} linhas/s"
+            f"  pico RSS {result['peak_rss_mb']:7.1f} MB (dados: {result['setup_rss_mb']:.1f} MB)")
+    if 'baseline_rows_per_second' in result:
+        change = result['rows_per_second'] / result['baseline_rows_per_second'] - 1
+        line += f"  {change:+.0%} vs baseline"
+        if result['regression']:
+            line += "  <-- REGRESSÃO"
+    return line
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,19 @@
 import streamlit as st
 import requests
-import pandas as pd
+from requests.adapters import HTTPAdapter
+import gzip
+import hashlib
 import io
+import json
 from urllib.parse import urlparse
 import plotly.graph_objects as go
 
 # --- Configuração ---
-BACKEND_URL = "http://127.0.0.1:8000/analyze"
+BACKEND_URL = "http://127.0.0.1:8000"
+JOBS_URL = f"{BACKEND_URL}/jobs"
+
+# Quantidade de arquivos diferentes com resultados mantidos em cache por sessão
+MAX_CACHED_RESULTS = 8
 
 st.set_page_config(
     page_title="Analisador de Hábitos Digitais com IA",
@@ -14,92 +21,8 @@ st.set_page_config(
     layout="wide"
 )
 
-# --- Dicionário de Palavras-chave para Análise DISC ---
-DISC_KEYWORDS = {
-    'Dominance (D)': [
-        'investing.com', 'tradingview.com', 'bloomberg.com', 'wsj.com', 'forbes.com', 
-        'businessinsider.com', 'cnbc.com', 'reuters.com', 'marketwatch.com', 'financial',
-        'stocks', 'crypto', 'leadership', 'management', 'strategy', 'competition'
-    ],
-    'Influence (I)': [
-        'instagram.com', 'x.com', 'facebook.com', 'tiktok.com', 'linkedin.com', 
-        'social', 'marketing', 'networking', 'influencer', 'fashion', 'entertainment',
-        'celebrity', 'events', 'community', 'trends'
-    ],
-    'Steadiness (S)': [
-        'pinterest.com', 'web.whatsapp.com', 'telegram.org', 'allrecipes.com', 'cooking',
-        'gardening', 'family', 'home', 'well-being', 'meditation', 'community',
-        'support', 'routine', 'planning', 'stability'
-    ],
-    'Conscientiousness (C)': [
-        'github.com', 'stackoverflow.com', 'scholar.google.com', 'arxiv.org', 'pypi.org', 
-        'docs.python.org', 'medium.com', 'wikipedia.org', 'research', 'analysis', 'data',
-        'science', 'programming', 'tutorial', 'documentation', 'learning', 'how-to'
-    ]
-}
-
-# --- Funções de Análise e Visualização DISC ---
-
-def analyze_disc_from_history(csv_content: str):
-    """
-    Analisa o conteúdo do CSV para gerar scores DISC baseados em palavras-chave.
-    Esta função foi reescrita para ser mais robusta contra vírgulas nas URLs.
-    """
-    try:
-        lines = csv_content.strip().split('\n')
-        if len(lines) < 2:
-            st.warning("Arquivo CSV vazio ou sem dados.")
-            return None
-
-        # Pega o cabeçalho
-        header = lines[0].strip().split(',')
-        if header != ['URL', 'Last Visited', 'Visit Count']:
-             st.warning("O formato do cabeçalho do CSV parece incorreto. A análise DISC pode falhar.")
-
-        data_rows = []
-        for i, line in enumerate(lines[1:], 1):
-            # rsplit(',', 2) divide a string a partir da direita, no máximo 2 vezes.
-            # Isso isola corretamente a data e a contagem, deixando o resto (a URL) junto.
-            parts = line.rsplit(',', 2)
-            if len(parts) == 3:
-                data_rows.append(parts)
-            else:
-                # Informa sobre uma linha malformada, mas continua o processo
-                print(f"Aviso: Linha {i+1} ignorada por ter um formato inesperado: {line[:100]}...")
-
-        if not data_rows:
-            st.warning("Nenhuma linha de dados válida encontrada no CSV.")
-            return None
-
-        df = pd.DataFrame(data_rows, columns=['URL', 'Last Visited', 'Visit Count'])
-        
-        # Converte a contagem para numérico, tratando possíveis erros
-        df['Visit Count'] = pd.to_numeric(df['Visit Count'], errors='coerce').fillna(0).astype(int)
-
-        scores = {'Dominance (D)': 0, 'Influence (I)': 0, 'Steadiness (S)': 0, 'Conscientiousness (C)': 0}
-        
-        for index, row in df.iterrows():
-            url = str(row['URL']).lower()
-            count = row['Visit Count']
-            
-            for profile, keywords in DISC_KEYWORDS.items():
-                for keyword in keywords:
-                    if keyword in url:
-                        scores[profile] += count
-                        break # Evita contar a mesma URL múltiplas vezes para o mesmo perfil
-
-        total_score = sum(scores.values())
-        if total_score == 0:
-            st.info("Nenhuma palavra-chave para a análise DISC foi encontrada no seu histórico.")
-            return None
-
-        normalized_scores = {k: (v / total_score) * 100 for k, v in scores.items()}
-        return normalized_scores
-        
-    except Exception as e:
-        st.warning(f"Não foi possível gerar a análise DISC: {e}")
-        return None
-
+# --- Funções de Visualização DISC ---
+# Os scores DISC são calculados pelo backend, na mesma passada que resume o histórico.
 
 def create_disc_radar_chart(scores: dict):
     """
@@ -143,6 +66,85 @@ def get_disc_interpretation(profile: str):
     return interpretations.get(profile, "")
 
 
+# --- Cache e Conexões ---
+
+@st.cache_resource
+def get_http_session() -> requests.Session:
+    """
+    Sessão HTTP compartilhada entre reruns, reaproveitando conexões keep-alive com o backend.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+@st.cache_data(max_entries=MAX_CACHED_RESULTS)
+def compress_upload(file_hash: str, _file_bytes: bytes) -> bytes:
+    """
+    Compacta o arquivo enviado; o cache usa apenas o hash (argumentos com `_` não entram na chave).
+    """
+    return gzip.compress(_file_bytes, compresslevel=6)
+
+@st.cache_data(max_entries=MAX_CACHED_RESULTS)
+def get_disc_chart(file_hash: str, _scores: dict):
+    return create_disc_radar_chart(_scores)
+
+def remember_result(file_hash: str, result: dict) -> None:
+    """
+    Guarda o resultado da análise na sessão, descartando os mais antigos acima do limite.
+    """
+    results = st.session_state.setdefault("results_by_hash", {})
+    results.pop(file_hash, None)
+    results[file_hash] = result
+    while len(results) > MAX_CACHED_RESULTS:
+        results.pop(next(iter(results)))
+
+
+def submit_backend_job(file_hash: str, file_bytes: bytes, filename: str) -> dict:
+    """
+    Envia o arquivo compactado (gzip) para o backend, que inicia um job para
+    resumir o histórico, calcular os scores DISC e gerar a análise da IA.
+    Lança requests.HTTPError se o backend recusar o arquivo.
+    """
+    compressed = compress_upload(file_hash, file_bytes)
+    files = {"file": (f"{filename}.gz", compressed, "application/gzip")}
+    response = get_http_session().post(f"{JOBS_URL}/upload", files=files, timeout=300)
+    response.raise_for_status()
+    return response.json()
+
+def stream_backend_analysis(job_id: str, placeholder, on_summary) -> tuple[str, bool]:
+    """
+    Acompanha o relatório de um job via Server-Sent Events, renderizando o
+    Markdown no `placeholder` conforme ele é gerado. `on_summary` recebe os
+    scores DISC e as reduções assim que o backend termina de resumir o histórico.
+    Retorna o texto e se o job terminou com sucesso.
+    """
+    analysis = ""
+    event = None
+    completed = False
+    # O backend envia keep-alives periódicos, então o timeout de leitura vale entre mensagens
+    with get_http_session().get(f"{JOBS_URL}/{job_id}/stream", stream=True, timeout=(10, 300)) as stream:
+        stream.encoding = "utf-8"
+        for line in stream.iter_lines(decode_unicode=True):
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                data = json.loads(line[len("data:"):])
+                if event == "summary":
+                    on_summary(data)
+                elif event == "chunk":
+                    analysis += data["text"]
+                    placeholder.markdown(analysis)
+                elif event == "done":
+                    completed = True
+                elif event == "error":
+                    analysis += f"\n\n**Erro ao analisar o arquivo.** O servidor respondeu com o status: {data['status_code']}\n\nDetalhes: ```{data['detail']}```"
+            elif not line:
+                event = None
+    return analysis, completed
+
+
 # --- Interface Principal ---
 
 st.title("🧠 Analisador de Hábitos Digitais com IA")
@@ -155,20 +157,23 @@ st.info("""
 **Aviso de Privacidade e Uso de Dados:**
 - **Processamento seguro no servidor:** Ao fazer o upload, seu histórico é processado em nosso servidor.
 - **Privacidade em primeiro lugar:** Apenas um **resumo anônimo**, contendo os sites visitados (domínios) e a contagem de visitas por dia, é enviado para a análise da IA. As URLs completas e específicas nunca saem do nosso servidor.
-- **Não armazenamos seus dados:** O conteúdo do arquivo e seu resumo são usados apenas para a análise e descartados em seguida.
+- **Não armazenamos seus dados:** O conteúdo do arquivo e seu resumo enviados por esta página são usados apenas para a análise e descartados em seguida. Apenas quem usa a análise incremental da API (com uma chave de usuário própria) tem os totais diários de visitas por domínio guardados no servidor, até apagá-los.
 - **Responsabilidade do Usuário:** Revise seu histórico antes do upload se houver informações sensíveis que não queira processar.
 """)
 
+# Sem filtro de extensão: o `History` do Chrome não tem extensão, e o backend
+# reconhece o formato (CSV ou banco do navegador) pelo conteúdo
 uploaded_file = st.file_uploader(
-    "Carregue seu histórico de navegação (apenas formato .csv)",
-    type=['csv']
+    "Carregue seu histórico de navegação (.csv exportado pela extensão, `History` do Chrome ou `places.sqlite` do Firefox)",
+    type=None
 )
 
 if uploaded_file is not None:
     if st.button("Analisar Histórico", type="primary"):
         try:
-            file_content = uploaded_file.getvalue().decode("utf-8")
+            file_bytes = uploaded_file.getvalue()
             filename = uploaded_file.name
+            file_hash = hashlib.sha256(file_bytes).hexdigest()
 
             # Limpar resultados antigos da sessão
             st.session_state.analysis_done = False
@@ -176,27 +181,46 @@ if uploaded_file is not None:
             st.session_state.disc_chart = None
             st.session_state.disc_scores = None
 
-            with st.spinner(f"Analisando '{filename}'... Gerando perfil DISC e consultando a IA. Isso pode levar um minuto! 🤖"):
-                # --- Análise DISC Local (Frontend) ---
-                disc_scores = analyze_disc_from_history(file_content)
-                if disc_scores:
-                    st.session_state.disc_scores = disc_scores
-                    st.session_state.disc_chart = create_disc_radar_chart(disc_scores)
-
-                # --- Análise Gemini (Backend) ---
-                payload = {"content": file_content, "filename": filename}
-                try:
-                    response = requests.post(BACKEND_URL, json=payload, timeout=300)
-                    if response.status_code == 200:
-                        result = response.json()
-                        st.session_state.analysis_result = result['analysis']
-                    else:
+            cached_result = st.session_state.get("results_by_hash", {}).get(file_hash)
+            if cached_result:
+                # Mesmo arquivo já analisado nesta sessão: reaproveita o resultado
+                st.session_state.disc_scores = cached_result["disc_scores"]
+                if cached_result["disc_scores"]:
+                    st.session_state.disc_chart = get_disc_chart(file_hash, cached_result["disc_scores"])
+                st.session_state.analysis_result = cached_result["analysis"]
+                st.session_state.analysis_done = True
+
+            else:
+                with st.spinner(f"Analisando '{filename}'... Gerando perfil DISC e consultando a IA. Isso pode levar um minuto! 🤖"):
+                    try:
+                        job = submit_backend_job(file_hash, file_bytes, filename)
+
+                        # --- Perfil DISC, calculado pelo backend assim que o histórico é resumido ---
+                        def show_disc_scores(summary: dict) -> None:
+                            disc_scores = summary.get("disc_scores")
+                            st.session_state.disc_scores = disc_scores
+                            if disc_scores:
+                                st.session_state.disc_chart = get_disc_chart(file_hash, disc_scores)
+                            else:
+                                st.info("Nenhuma palavra-chave para a análise DISC foi encontrada no seu histórico.")
+
+                        # --- Análise Gemini (Backend), exibida conforme é gerada ---
+                        streaming_placeholder = st.empty()
+                        analysis, completed = stream_backend_analysis(job["job_id"], streaming_placeholder, show_disc_scores)
+                        st.session_state.analysis_result = analysis
+                        # O resultado completo é exibido na seção de resultados abaixo
+                        streaming_placeholder.empty()
+                        if completed:
+                            remember_result(file_hash, {"disc_scores": st.session_state.disc_scores, "analysis": analysis})
+
+                    except requests.exceptions.HTTPError as e:
+                        response = e.response
                         st.session_state.analysis_result = f"**Erro ao analisar o arquivo.** O servidor respondeu com o status: {response.status_code}\n\nDetalhes: ```{response.text}```"
+
+                    except requests.exceptions.RequestException as e:
+                        st.session_state.analysis_result = f"**Erro de conexão com o servidor de análise.** Verifique se o backend está rodando.\n\nDetalhes técnicos: ```{e}```"
                 
-                except requests.exceptions.RequestException as e:
-                    st.session_state.analysis_result = f"**Erro de conexão com o servidor de análise.** Verifique se o backend está rodando.\n\nDetalhes técnicos: ```{e}```"
-                
-                st.session_state.analysis_done = True
+                    st.session_state.analysis_done = True
         
         except Exception as e:
             st.error(f"Ocorreu um erro ao ler ou processar o arquivo: {e}")